@@ -0,0 +1,110 @@
+import Rollups
+from Database import year_range
+from QueryCache import ALL_DATA_SCOPE, cached, city_year_scope, date_range_scopes, year_scope
+from Shards import ShardRouter, use_shards
+
+# The analytics queries behind Phase 1, returning plain dicts so results can be cached, pickled and sent as JSON
+# Each one is answered from the rollup tables when possible and from the raw daily rows otherwise
+# Database errors are raised to the caller; list queries take keyset paging arguments (after, limit)
+# On a sharded database (see Shards.py) the raw rows are read from the shards overlapping each query's dates
+
+# Function to fetch countries ordered by id, continuing after the given country id
+@cached(lambda after=None, limit=None: [ALL_DATA_SCOPE])
+def countries(connection, after=None, limit=None):
+    cursor = connection.cursor()
+    cursor.execute("SELECT id, name, timezone FROM countries WHERE id > ? ORDER BY id LIMIT ?",
+                   (after if after is not None else -1, limit if limit is not None else -1))
+    rows = [dict(zip(("id", "name", "timezone"), row)) for row in cursor.fetchall()]
+    cursor.close()
+    return rows
+
+# Function to fetch cities ordered by id, continuing after the given city id
+@cached(lambda after=None, limit=None: [ALL_DATA_SCOPE])
+def cities(connection, after=None, limit=None):
+    cursor = connection.cursor()
+    cursor.execute("SELECT id, name, latitude, longitude, country_id FROM cities WHERE id > ? ORDER BY id LIMIT ?",
+                   (after if after is not None else -1, limit if limit is not None else -1))
+    rows = [dict(zip(("id", "name", "latitude", "longitude", "country_id"), row)) for row in cursor.fetchall()]
+    cursor.close()
+    return rows
+
+# Function to calculate the average annual temperature for a city and year; None if there is no data
+@cached(lambda city_id, year: [city_year_scope(city_id, year)])
+def average_annual_temperature(connection, city_id, year):
+    result = Rollups.average_annual_temperature(connection, city_id, year)
+    if result is None:
+        query = """
+        SELECT c.name AS city_name, AVG(d.mean_temp) AS avg_temp
+        FROM daily_weather_entries d
+        JOIN cities c ON d.city_id = c.id
+        WHERE d.city_id = ? AND d.date >= ? AND d.date < ?
+        GROUP BY c.name
+        """
+        use_shards(connection, f"{int(year):04d}-01-01", f"{int(year):04d}-12-31")
+        cursor = connection.cursor()
+        cursor.execute(query, (city_id, *year_range(year)))
+        result = cursor.fetchone()
+        cursor.close()
+    return {"city_name": result[0], "avg_temp": result[1]} if result else None
+
+# Function to calculate the average precipitation over the 7 days starting at start_date; None if there is no data
+# The 7 days can run into the next year, so the result depends on both years
+@cached(lambda city_id, start_date: [city_year_scope(city_id, start_date[:4]), city_year_scope(city_id, int(start_date[:4]) + 1)])
+def average_seven_day_precipitation(connection, city_id, start_date):
+    query = """
+    SELECT c.name AS city_name, AVG(d.precipitation) AS avg_precip
+    FROM daily_weather_entries d
+    JOIN cities c ON d.city_id = c.id
+    WHERE d.city_id = ? AND d.date >= ? AND d.date < date(?, '+7 day')
+    GROUP BY c.name
+    """
+    use_shards(connection, start_date, f"{int(start_date[:4]) + 1:04d}-01-06")
+    cursor = connection.cursor()
+    cursor.execute(query, (city_id, start_date, start_date))
+    result = cursor.fetchone()
+    cursor.close()
+    return {"city_name": result[0], "avg_precip": result[1]} if result else None
+
+# Function to calculate the average mean temperature per city over an inclusive date range, ordered by city name
+@cached(lambda date_from, date_to, after=None, limit=None: date_range_scopes(date_from, date_to))
+def average_mean_temp_by_city(connection, date_from, date_to, after=None, limit=None):
+    rows = Rollups.average_mean_temp_by_city(connection, date_from, date_to, after, limit)
+    shard_router = ShardRouter.for_connection(connection) if rows is None else None
+    if shard_router is not None:
+        # Any number of shards: each group of shards is aggregated in turn and the totals merged
+        rows = shard_router.average_mean_temp_by_city(connection, date_from, date_to, after, limit)
+    elif rows is None:
+        where, where_params, order, order_params = Rollups.page_clauses("c.name", after, limit)
+        query = f"""
+        SELECT c.name AS city_name, AVG(d.mean_temp) AS avg_temp
+        FROM daily_weather_entries d
+        JOIN cities c ON d.city_id = c.id
+        WHERE d.date BETWEEN ? AND ?{where}
+        GROUP BY c.name{order}
+        """
+        cursor = connection.cursor()
+        cursor.execute(query, (date_from, date_to, *where_params, *order_params))
+        rows = cursor.fetchall()
+        cursor.close()
+    return [{"city_name": row[0], "avg_temp": row[1]} for row in rows]
+
+# Function to calculate the average annual precipitation per country, ordered by country name
+@cached(lambda year, after=None, limit=None: [year_scope(year)])
+def average_annual_precipitation_by_country(connection, year, after=None, limit=None):
+    rows = Rollups.average_annual_precipitation_by_country(connection, year, after, limit)
+    if rows is None:
+        where, where_params, order, order_params = Rollups.page_clauses("co.name", after, limit)
+        query = f"""
+        SELECT co.name AS country_name, AVG(d.precipitation) AS avg_precip
+        FROM cities ci
+        JOIN countries co ON ci.country_id = co.id
+        JOIN daily_weather_entries d ON ci.id = d.city_id
+        WHERE d.date >= ? AND d.date < ?{where}
+        GROUP BY co.name{order}
+        """
+        use_shards(connection, f"{int(year):04d}-01-01", f"{int(year):04d}-12-31")
+        cursor = connection.cursor()
+        cursor.execute(query, (*year_range(year), *where_params, *order_params))
+        rows = cursor.fetchall()
+        cursor.close()
+    return [{"country_name": row[0], "avg_precip": row[1]} for row in rows]
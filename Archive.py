@@ -0,0 +1,188 @@
+import json
+import os
+import sqlite3
+import numpy as np
+from ColumnStore import from_day_number, to_day_number
+from Database import DATABASE_PATH, BulkLoader
+from Shards import use_shards
+from WeatherSchema import DAILY_COLUMNS
+
+# Name of the index file describing every city file in an archive directory
+INDEX_FILE = "index.json"
+
+# Archive format version, stored in the index so readers can refuse files they do not understand
+# Version 2 archives every daily column; version 1 archives (four metrics) can still be read
+ARCHIVE_VERSION = 2
+READABLE_VERSIONS = (1, 2)
+
+# Metrics written to new archives: every daily_weather_entries column
+METRICS = list(DAILY_COLUMNS.values())
+
+# API variable names for each archived metric, used when importing back into the database
+METRIC_API_NAMES = {column: variable for variable, column in DAILY_COLUMNS.items()}
+
+# Function to return the file name used for a city's data
+def city_file_name(city_id):
+    return f"city_{city_id}.npy"
+
+# Function to write one city's rows as a dense (metrics x days) float32 .npy file, NaN for missing days
+def write_city_file(path, dates, rows):
+    days = to_day_number(dates)
+    first_day = int(days[0])
+    values = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(len(METRICS), int(days[-1]) - first_day + 1))
+    values[:] = np.nan
+    values[:, days - first_day] = np.array(rows, dtype=np.float64).T.astype(np.float32)
+    values.flush()
+    del values
+    return first_day
+
+# Function to return the SELECT expressions for every archived metric, reading NULL for columns
+# that a database not yet migrated by ensure_schema does not have
+def metric_columns(cursor):
+    cursor.execute("PRAGMA table_info(daily_weather_entries)")
+    stored = {row[1] for row in cursor.fetchall()}
+    return ", ".join(metric if metric in stored else f"NULL AS {metric}" for metric in METRICS)
+
+# Function to export daily_weather_entries from the SQLite database into an archive directory, one file per city
+def export_archive(archive_dir, db_path=DATABASE_PATH, city_ids=None):
+    os.makedirs(archive_dir, exist_ok=True)
+    index = {"version": ARCHIVE_VERSION, "metrics": METRICS, "cities": {}}
+    try:
+        with sqlite3.connect(db_path) as conn:
+            use_shards(conn)
+            cursor = conn.cursor()
+            columns = metric_columns(cursor)
+            cursor.execute('''
+                SELECT ci.id, ci.name, ci.country_id, co.name
+                FROM cities ci LEFT JOIN countries co ON ci.country_id = co.id
+            ''')
+            cities = cursor.fetchall()
+            for city_id, name, country_id, country_name in cities:
+                if city_ids and city_id not in city_ids:
+                    continue
+                cursor.execute(f'''
+                    SELECT date, {columns} FROM daily_weather_entries
+                    WHERE city_id = ? ORDER BY date
+                ''', (city_id,))
+                data = cursor.fetchall()
+                if not data:
+                    continue
+                first_day = write_city_file(os.path.join(archive_dir, city_file_name(city_id)),
+                                            [row[0] for row in data], [row[1:] for row in data])
+                index["cities"][str(city_id)] = {
+                    "name": name,
+                    "country_id": country_id,
+                    "country_name": country_name,
+                    "first_day": first_day,
+                    "file": city_file_name(city_id),
+                }
+                print(f"Archived {len(data)} days for {name}")
+            cursor.close()
+    except sqlite3.Error as ex:
+        print(f"Error exporting weather data to the archive: {ex}")
+        return None
+
+    with open(os.path.join(archive_dir, INDEX_FILE), "w") as index_file:
+        json.dump(index, index_file, indent=2)
+    return index
+
+# Class to query an archive directory through read-only memory maps, so processes share pages via the OS cache
+class WeatherArchive:
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        with open(os.path.join(archive_dir, INDEX_FILE)) as index_file:
+            index = json.load(index_file)
+        if index.get("version") not in READABLE_VERSIONS:
+            raise ValueError(f"Unsupported archive version: {index.get('version')}")
+        self.metric_rows = {metric: i for i, metric in enumerate(index["metrics"])}
+        self.cities = {int(city_id): info for city_id, info in index["cities"].items()}
+        self.maps = {}
+
+    # Return the memory-mapped (metrics x days) array for a city, or None if it is not archived
+    def values(self, city_id):
+        if city_id not in self.cities:
+            return None
+        if city_id not in self.maps:
+            self.maps[city_id] = np.load(os.path.join(self.archive_dir, self.cities[city_id]["file"]), mmap_mode="r")
+        return self.maps[city_id]
+
+    # Return a zero-copy view of a metric for the half-open date range [date_from, date_to)
+    def metric_range(self, city_id, metric, date_from, date_to):
+        values = self.values(city_id)
+        if values is None:
+            return np.array([], dtype=np.float32)
+        first_day = self.cities[city_id]["first_day"]
+        start = max(int(to_day_number(date_from)) - first_day, 0)
+        end = max(int(to_day_number(date_to)) - first_day, 0)
+        return values[self.metric_rows[metric], start:end]
+
+    # Sum and count of the non-missing values of a metric in a date range
+    def _sum_count(self, city_id, metric, date_from, date_to):
+        values = self.metric_range(city_id, metric, date_from, date_to)
+        valid = ~np.isnan(values)
+        return float(values[valid].sum(dtype=np.float64)), int(valid.sum())
+
+    # Average annual temperature for a city and year, or None if there is no data
+    def average_annual_temperature(self, city_id, year):
+        total, count = self._sum_count(city_id, "mean_temp", f"{int(year):04d}-01-01", f"{int(year) + 1:04d}-01-01")
+        return total / count if count else None
+
+    # Average precipitation over the 7 days starting at start_date, or None if there is no data
+    def average_seven_day_precipitation(self, city_id, start_date):
+        end_date = str(from_day_number(to_day_number(start_date) + 7))
+        total, count = self._sum_count(city_id, "precipitation", start_date, end_date)
+        return total / count if count else None
+
+    # Average mean temperature per city name over an inclusive date range
+    def average_mean_temp_by_city(self, date_from, date_to):
+        end_date = str(from_day_number(to_day_number(date_to) + 1))
+        totals = {}
+        for city_id, info in self.cities.items():
+            total, count = self._sum_count(city_id, "mean_temp", date_from, end_date)
+            if count:
+                name_total, name_count = totals.get(info["name"], (0.0, 0))
+                totals[info["name"]] = (name_total + total, name_count + count)
+        return {name: total / count for name, (total, count) in totals.items()}
+
+    # Average annual precipitation per country name
+    def average_annual_precipitation_by_country(self, year):
+        totals = {}
+        for city_id, info in self.cities.items():
+            if info["country_name"] is None:
+                continue
+            total, count = self._sum_count(city_id, "precipitation", f"{int(year):04d}-01-01", f"{int(year) + 1:04d}-01-01")
+            if count:
+                country_total, country_count = totals.get(info["country_name"], (0.0, 0))
+                totals[info["country_name"]] = (country_total + total, country_count + count)
+        return {name: total / count for name, (total, count) in totals.items()}
+
+# Function to load an archive directory back into the SQLite database
+# The import upserts every daily column, so an archive missing some columns would clear them; it is refused instead
+def import_archive(archive_dir, db_path=DATABASE_PATH):
+    archive = WeatherArchive(archive_dir)
+    missing = [column for column in METRICS if column not in archive.metric_rows]
+    if missing:
+        raise ValueError(f"Archive {archive_dir} has no {', '.join(missing)} data; importing it would clear those columns. "
+                         f"Re-export it with this version first")
+    with BulkLoader(db_path) as loader:
+        for city_id, info in archive.cities.items():
+            values = archive.values(city_id)
+            days = np.arange(info["first_day"], info["first_day"] + values.shape[1], dtype=np.int32)
+            # Only days with at least one stored metric were rows in the database
+            present = ~np.all(np.isnan(values), axis=0)
+            daily_data = {"time": list(from_day_number(days[present]))}
+            for metric, row in archive.metric_rows.items():
+                column = values[row, present].astype(np.float64)
+                daily_data[METRIC_API_NAMES[metric]] = [None if np.isnan(value) else float(value) for value in column]
+            loader.add(info["name"], daily_data, None, None, info["country_id"])
+            print(f"Imported {len(daily_data['time'])} days for {info['name']}")
+
+# Export or import an archive from the command line: python Archive.py export|import <archive_dir>
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) != 3 or sys.argv[1] not in ("export", "import"):
+        print("Usage: python Archive.py export|import <archive_dir>")
+    elif sys.argv[1] == "export":
+        export_archive(sys.argv[2])
+    else:
+        import_archive(sys.argv[2])
@@ -0,0 +1,64 @@
+import json
+import random
+import sys
+import time
+from datetime import date, timedelta
+import OpenMeteo
+from OpenMeteo import JSON_DECODERS, decode_json, set_json_decoder, split_daily_data
+from WeatherSchema import DAILY_COLUMNS, daily_rows
+
+# Function to build a multi-location archive API response body with random daily values
+def synthetic_response(locations, days, start_date="1990-01-01"):
+    first = date.fromisoformat(start_date)
+    dates = [(first + timedelta(days=i)).isoformat() for i in range(days)]
+    body = []
+    for _ in range(locations):
+        daily = {"time": dates}
+        for variable in DAILY_COLUMNS:
+            daily[variable] = [round(random.uniform(-10, 30), 1) for _ in range(days)]
+        body.append({"daily": daily})
+    return json.dumps(body).encode()
+
+# Function building rows the way insert_weather_data used to: indexing each column list per row
+def indexed_rows(city_id, daily_data):
+    return [
+        (city_id, daily_data["time"][i], daily_data["temperature_2m_min"][i],
+         daily_data["temperature_2m_max"][i], daily_data["temperature_2m_mean"][i],
+         daily_data["precipitation_sum"][i])
+        for i in range(len(daily_data["time"]))
+    ]
+
+# Function to time decoding a response and building its rows, returning the best of several runs in seconds
+def time_path(content, locations, decoder, row_func, repeats=5):
+    set_json_decoder(decoder)
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for city_id, daily_data in enumerate(split_daily_data(decode_json(content), locations)):
+            row_func(city_id, daily_data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+# Function to compare the original path (stdlib json, indexed rows) with every installed decoder and the column-zip rows
+def run_benchmark(locations=50, days=365 * 30, repeats=5):
+    content = synthetic_response(locations, days)
+    rows = locations * days
+    print(f"Decoding {len(content) / 1e6:.1f} MB ({locations} locations x {days} days) and building {rows} rows")
+
+    paths = [("json + indexed rows (original)", "json", indexed_rows)]
+    paths += [(f"{name} + column-zip rows", name, daily_rows) for name in JSON_DECODERS]
+    baseline = None
+    selected = OpenMeteo.JSON_DECODER
+    try:
+        for label, decoder, row_func in paths:
+            seconds = time_path(content, locations, decoder, row_func, repeats)
+            baseline = baseline or seconds
+            print(f"  {label:<34} {seconds * 1000:8.1f} ms  {rows / seconds / 1e6:6.2f} M rows/s  {baseline / seconds:5.2f}x")
+    finally:
+        set_json_decoder(selected)
+
+# Benchmark from the command line: python Benchmark.py [locations] [days]
+if __name__ == "__main__":
+    arguments = [int(argument) for argument in sys.argv[1:3]]
+    run_benchmark(*arguments)
@@ -0,0 +1,193 @@
+import sqlite3
+import numpy as np
+from Database import DATABASE_PATH
+from Shards import use_shards
+
+# Metric columns loaded from daily_weather_entries
+METRICS = ["min_temp", "max_temp", "mean_temp", "precipitation"]
+
+# Number of rows pulled from SQLite per fetchmany call while loading
+LOAD_CHUNK_SIZE = 100000
+
+# Function to convert ISO date strings (or a single string) to int days since 1970-01-01
+def to_day_number(dates):
+    return np.asarray(dates, dtype="datetime64[D]").astype(np.int32)
+
+# Function to convert int days since 1970-01-01 back to ISO date strings
+def from_day_number(days):
+    return np.asarray(days, dtype=np.int32).astype("datetime64[D]").astype(str)
+
+# Class holding one city's daily data as contiguous arrays sorted by day
+class CityColumns:
+    def __init__(self, city_id, name, days, metrics):
+        self.city_id = city_id
+        self.name = name
+        self.days = days
+        self.metrics = metrics
+
+    def __len__(self):
+        return len(self.days)
+
+    # Return the slice of rows falling in the half-open day range [start_day, end_day)
+    def day_slice(self, start_day, end_day):
+        start = np.searchsorted(self.days, start_day, side="left")
+        end = np.searchsorted(self.days, end_day, side="left")
+        return slice(start, end)
+
+    # Return the metric as a dense daily series from the first to the last stored day, NaN for missing days
+    def dense(self, metric):
+        if len(self.days) == 0:
+            return self.days, self.metrics[metric]
+        first = self.days[0]
+        dense_days = np.arange(first, self.days[-1] + 1, dtype=np.int32)
+        values = np.full(len(dense_days), np.nan, dtype=np.float32)
+        values[self.days - first] = self.metrics[metric]
+        return dense_days, values
+
+# Class to load daily_weather_entries into per-city NumPy arrays and answer the analytics aggregates from memory
+class WeatherColumnStore:
+    def __init__(self):
+        self.cities = {}
+
+    @classmethod
+    def load(cls, connection, city_ids=None):
+        store = cls()
+        cursor = connection.cursor()
+        cursor.execute("SELECT id, name FROM cities")
+        names = {row[0]: row[1] for row in cursor.fetchall()}
+
+        query = f"SELECT city_id, date, {', '.join(METRICS)} FROM daily_weather_entries"
+        params = ()
+        if city_ids:
+            query += f" WHERE city_id IN ({', '.join('?' for _ in city_ids)})"
+            params = tuple(city_ids)
+        query += " ORDER BY city_id, date"
+        use_shards(connection)
+        cursor.execute(query, params)
+
+        # Rows arrive grouped by city, so each city's rows are collected and converted in one go
+        current_id = None
+        current_rows = []
+        while True:
+            chunk = cursor.fetchmany(LOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            for row in chunk:
+                if row[0] != current_id:
+                    if current_rows:
+                        store._add_city(current_id, names.get(current_id), current_rows)
+                    current_id = row[0]
+                    current_rows = []
+                current_rows.append(tuple(row[1:]))
+        if current_rows:
+            store._add_city(current_id, names.get(current_id), current_rows)
+        cursor.close()
+        return store
+
+    def _add_city(self, city_id, name, rows):
+        columns = list(zip(*rows))
+        days = to_day_number(columns[0])
+        # None becomes NaN when converted to a float array
+        metrics = {metric: np.array(columns[i + 1], dtype=np.float64).astype(np.float32) for i, metric in enumerate(METRICS)}
+        self.cities[city_id] = CityColumns(city_id, name, days, metrics)
+
+    def city(self, city_id):
+        return self.cities.get(city_id)
+
+    # Vectorised average_annual_temperature: mean of a metric for one city and year, NaN if there is no data
+    def annual_mean(self, city_id, year, metric="mean_temp"):
+        city = self.cities.get(city_id)
+        if city is None:
+            return np.nan
+        values = city.metrics[metric][city.day_slice(to_day_number(f"{int(year):04d}-01-01"), to_day_number(f"{int(year) + 1:04d}-01-01"))]
+        return float(np.nanmean(values)) if np.any(~np.isnan(values)) else np.nan
+
+    # Mean of a metric for every year one city has data for, as (years, means) arrays
+    def annual_means(self, city_id, metric="mean_temp"):
+        city = self.cities.get(city_id)
+        if city is None or len(city) == 0:
+            return np.array([], dtype=np.int32), np.array([], dtype=np.float64)
+        years = city.days.astype("datetime64[D]").astype("datetime64[Y]").astype(np.int32) + 1970
+        values = city.metrics[metric].astype(np.float64)
+        valid = ~np.isnan(values)
+        unique_years, inverse = np.unique(years, return_inverse=True)
+        sums = np.bincount(inverse[valid], weights=values[valid], minlength=len(unique_years))
+        counts = np.bincount(inverse[valid], minlength=len(unique_years))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return unique_years, sums / counts
+
+    # Vectorised average_mean_temp_by_city: mean of a metric per city name over an inclusive date range
+    def mean_by_city(self, date_from, date_to, metric="mean_temp"):
+        start_day = to_day_number(date_from)
+        end_day = to_day_number(date_to) + 1
+        # average_mean_temp_by_city groups by city name, so cities sharing a name are pooled
+        totals = {}
+        for city in self.cities.values():
+            values = city.metrics[metric][city.day_slice(start_day, end_day)]
+            values = values[~np.isnan(values)]
+            if len(values):
+                total, count = totals.get(city.name, (0.0, 0))
+                totals[city.name] = (total + float(values.sum(dtype=np.float64)), count + len(values))
+        return {name: total / count for name, (total, count) in totals.items()}
+
+    # Rolling N-day sum of a metric for one city, as (days, sums); windows containing missing days are NaN
+    def rolling_sum(self, city_id, metric="precipitation", window=7):
+        city = self.cities.get(city_id)
+        if city is None or len(city) < window:
+            return np.array([], dtype=np.int32), np.array([], dtype=np.float64)
+        days, values = city.dense(metric)
+        values = values.astype(np.float64)
+        missing = np.isnan(values)
+        cumulative = np.concatenate(([0.0], np.cumsum(np.where(missing, 0.0, values))))
+        missing_count = np.concatenate(([0], np.cumsum(missing)))
+        sums = cumulative[window:] - cumulative[:-window]
+        sums[(missing_count[window:] - missing_count[:-window]) > 0] = np.nan
+        return days[window - 1:], sums
+
+    # Mean of a metric over the N days starting at each day from the first to the last stored day of one city,
+    # as (days, means); missing values are skipped and windows without any value are NaN
+    def forward_mean(self, city_id, metric="precipitation", window=7):
+        city = self.cities.get(city_id)
+        if city is None or len(city) == 0:
+            return np.array([], dtype=np.int32), np.array([], dtype=np.float64)
+        days, values = city.dense(metric)
+        values = values.astype(np.float64)
+        present = ~np.isnan(values)
+        cumulative = np.concatenate(([0.0], np.cumsum(np.where(present, values, 0.0))))
+        present_count = np.concatenate(([0], np.cumsum(present)))
+        starts = np.arange(len(days))
+        ends = np.minimum(starts + window, len(days))
+        counts = present_count[ends] - present_count[starts]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = (cumulative[ends] - cumulative[starts]) / counts
+        means[counts == 0] = np.nan
+        return days, means
+
+    # 7-day precipitation averages for every start day, the vectorised counterpart of
+    # Analytics.average_seven_day_precipitation (NaN where it returns no average)
+    def rolling_seven_day_precipitation(self, city_id):
+        return self.forward_mean(city_id, "precipitation", 7)
+
+    # Minimum and maximum of a metric for one city per period of the given numpy datetime unit ('M' or 'Y')
+    def min_max_per_period(self, city_id, metric="mean_temp", period="M"):
+        city = self.cities.get(city_id)
+        if city is None or len(city) == 0:
+            return np.array([], dtype=f"datetime64[{period}]"), np.array([]), np.array([])
+        periods = city.days.astype("datetime64[D]").astype(f"datetime64[{period}]")
+        values = city.metrics[metric]
+        valid = ~np.isnan(values)
+        periods, values = periods[valid], values[valid]
+        if len(values) == 0:
+            return periods, values, values
+        # Days are sorted, so each period is one contiguous run and reduceat works on the run starts
+        starts = np.concatenate(([0], np.flatnonzero(periods[1:] != periods[:-1]) + 1))
+        return periods[starts], np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts)
+
+# Function to load the column store from the database file, reporting errors like the other modules
+def load_column_store(db_path=DATABASE_PATH, city_ids=None):
+    try:
+        with sqlite3.connect(db_path) as connection:
+            return WeatherColumnStore.load(connection, city_ids)
+    except sqlite3.Error as ex:
+        print(f"Error loading weather data into the column store: {ex}")
+        return None
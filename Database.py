@@ -0,0 +1,207 @@
+import sqlite3
+from QueryCache import bump_generations, ensure_generation_table
+from Rollups import ensure_rollup_tables, refresh_rollups
+from Shards import ShardRouter
+from WeatherSchema import daily_rows, daily_upsert_sql, ensure_weather_columns, hourly_rows, hourly_upsert_sql
+
+# Database file shared by every module in the project
+DATABASE_PATH = 'CIS4044-N-SDI-OPENMETEO-PARTIAL.db'
+
+# Insert a day of weather data, or update it if the city already has a row for that date
+# The stored columns come from WeatherSchema.DAILY_COLUMNS; build the rows with WeatherSchema.daily_rows
+UPSERT_DAILY_WEATHER_SQL = daily_upsert_sql()
+
+# Function to check whether an index exists
+def index_exists(conn, index_name):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index_name,)).fetchone()
+    return row is not None
+
+# Function to add the unique (city_id, date) constraint, removing duplicate rows left by earlier runs first
+def ensure_unique_city_date(conn):
+    if index_exists(conn, 'idx_daily_weather_city_date'):
+        return
+    cursor = conn.execute('''
+        DELETE FROM daily_weather_entries
+        WHERE id NOT IN (SELECT MAX(id) FROM daily_weather_entries GROUP BY city_id, date)
+    ''')
+    if cursor.rowcount > 0:
+        print(f"Removed {cursor.rowcount} duplicate rows from daily_weather_entries")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_daily_weather_city_date ON daily_weather_entries (city_id, date)")
+    conn.commit()
+
+# Function to add the indexes used by the date-range analytics queries
+def ensure_indexes(conn):
+    if index_exists(conn, 'idx_daily_weather_date'):
+        return
+    print("Creating index on daily_weather_entries (date), this may take a while on large databases...")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_daily_weather_date ON daily_weather_entries (date)")
+    conn.execute("ANALYZE daily_weather_entries")
+    conn.commit()
+
+# Function to bring an existing database up to the current schema
+def ensure_schema(conn):
+    try:
+        # The unique (city_id, date) index doubles as the composite index for per-city date range queries
+        ensure_weather_columns(conn)
+        ensure_unique_city_date(conn)
+        ensure_indexes(conn)
+        ensure_rollup_tables(conn)
+        ensure_generation_table(conn)
+    except sqlite3.DatabaseError as e:
+        print(f"Database error occurred while updating the schema: {e}")
+
+# Function to return the half-open [start, end) date range covering a year, so queries can use the date indexes
+def year_range(year):
+    return f"{int(year):04d}-01-01", f"{int(year) + 1:04d}-01-01"
+
+# Number of rows fetched at a time when streaming query results
+FETCH_CHUNK_SIZE = 1000
+
+# Function to yield the rows of an executed cursor a chunk at a time instead of loading them all with fetchall
+def iter_rows(cursor, chunk_size=FETCH_CHUNK_SIZE):
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
+
+# Function to run a query and stream its rows in constant memory, closing the cursor when done
+def stream_query(connection, query, params=(), chunk_size=FETCH_CHUNK_SIZE):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(query, params)
+        yield from iter_rows(cursor, chunk_size)
+    finally:
+        cursor.close()
+
+# Pragmas used while bulk loading: WAL lets readers keep working, and NORMAL sync is safe under WAL
+BULK_LOAD_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -65536",
+    "PRAGMA temp_store = MEMORY",
+]
+
+# Pragmas used by long-lived read-only connections: reads go through a shared memory map of the database file
+READ_ONLY_PRAGMAS = [
+    "PRAGMA query_only = ON",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA cache_size = -16384",
+]
+
+# Function to open a read-only connection for queries, returning rows that can be accessed by column name
+def connect_read_only(db_path=DATABASE_PATH, check_same_thread=True):
+    connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=check_same_thread)
+    connection.row_factory = sqlite3.Row
+    for pragma in READ_ONLY_PRAGMAS:
+        connection.execute(pragma)
+    return connection
+
+# Class to load weather data for many cities through one connection in large transactions
+# add() buffers a city and writes the buffer every batch_rows rows, so a failed write loses every buffered city;
+# ingestion should pass write_batch to Ingestion.run_pipeline, which counts each failed batch as a whole
+class BulkLoader:
+    def __init__(self, db_path=DATABASE_PATH, batch_rows=50000):
+        self.batch_rows = batch_rows
+        self.pending = []
+        self.pending_hourly = []
+        self.pending_cities = []
+        self.rows_written = 0
+        # Only the single ingestion writer thread uses the connection, but it is opened on the calling thread
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        for pragma in BULK_LOAD_PRAGMAS:
+            self.conn.execute(pragma)
+        ensure_schema(self.conn)
+        self.city_ids = self.load_city_ids()
+        # Sharded databases (see Shards.py) keep their daily rows in the shard files
+        self.shard_router = ShardRouter.for_connection(self.conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # Load every known city id with one query instead of one query per city
+    def load_city_ids(self):
+        return {name: city_id for city_id, name in self.conn.execute("SELECT id, name FROM cities")}
+
+    # Insert all the given cities that are not in the cities table yet, in one transaction
+    def resolve_city_ids(self, cities):
+        new_cities = [city for city in cities if city["city"] not in self.city_ids]
+        with self.conn:
+            for city in new_cities:
+                cursor = self.conn.execute(
+                    "INSERT INTO cities (name, latitude, longitude, country_id) VALUES (?, ?, ?, ?)",
+                    (city["city"], city.get("lat"), city.get("lon"), city["country_id"]))
+                self.city_ids[city["city"]] = cursor.lastrowid
+        return {city["city"]: self.city_ids[city["city"]] for city in cities}
+
+    # Buffer a city's rows without writing them
+    def buffer(self, city_name, daily_data, lat, lon, country_id):
+        city_id = self.city_ids.get(city_name)
+        if city_id is None:
+            city_id = self.resolve_city_ids([{"city": city_name, "lat": lat, "lon": lon, "country_id": country_id}])[city_name]
+
+        self.pending.extend(daily_rows(city_id, daily_data))
+        if daily_data.get("hourly"):
+            self.pending_hourly.extend(hourly_rows(city_id, daily_data["hourly"]))
+        self.pending_cities.append(city_name)
+
+    def add(self, city_name, daily_data, lat, lon, country_id):
+        self.buffer(city_name, daily_data, lat, lon, country_id)
+        if len(self.pending) >= self.batch_rows or len(self.pending_hourly) >= self.batch_rows:
+            self.flush()
+
+    # Write (city_name, daily_data, lat, lon, country_id) items in a single transaction,
+    # as the batch write function of Ingestion.run_pipeline; nothing is written before the whole batch is buffered
+    def write_batch(self, items):
+        for city_name, daily_data, lat, lon, country_id in items:
+            self.buffer(city_name, daily_data, lat, lon, country_id)
+        self.flush()
+
+    # Write all buffered rows in a single transaction (on a sharded database, one per group of shards)
+    # On a database error the buffered rows are dropped and the error is raised, so the ingestion counts them as failed
+    def flush(self):
+        if not self.pending and not self.pending_hourly:
+            return
+        try:
+            if self.shard_router:
+                with self.conn:
+                    self.conn.executemany(hourly_upsert_sql(), self.pending_hourly)
+                # Daily rows, their rollups and generations are written one transaction per group of shards
+                self.shard_router.write_rows(self.conn, self.pending)
+            else:
+                with self.conn:
+                    self.conn.executemany(UPSERT_DAILY_WEATHER_SQL, self.pending)
+                    self.conn.executemany(hourly_upsert_sql(), self.pending_hourly)
+                    dates_by_city = {}
+                    for row in self.pending:
+                        dates_by_city.setdefault(row[0], set()).add(row[1])
+                    for city_id, dates in dates_by_city.items():
+                        refresh_rollups(self.conn, city_id, dates)
+                        bump_generations(self.conn, city_id, dates)
+            self.rows_written += len(self.pending)
+        except sqlite3.DatabaseError as e:
+            print(f"Database error occurred while bulk loading {len(self.pending)} rows; "
+                  f"data for {len(self.pending_cities)} cities was not stored ({', '.join(self.pending_cities)}): {e}")
+            raise
+        finally:
+            self.pending = []
+            self.pending_hourly = []
+            self.pending_cities = []
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.conn.close()
+
+# Run the schema migration against the database
+if __name__ == "__main__":
+    try:
+        with sqlite3.connect(DATABASE_PATH) as conn:
+            ensure_schema(conn)
+            print("Database schema is up to date.")
+    except sqlite3.Error as ex:
+        print(f"Error connecting to database: {ex}")
@@ -0,0 +1,45 @@
+import csv
+import json
+import sqlite3
+import sys
+from Database import DATABASE_PATH, FETCH_CHUNK_SIZE, iter_rows
+from Shards import use_shards
+
+# Function to stream every row of daily_weather_entries to a CSV or JSON Lines file without loading the table
+def export_weather_data(output_path, file_format="csv", db_path=DATABASE_PATH, chunk_size=FETCH_CHUNK_SIZE):
+    count = 0
+    try:
+        with sqlite3.connect(db_path) as conn, open(output_path, "w", newline="", encoding="utf-8") as output:
+            use_shards(conn)
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM daily_weather_entries ORDER BY city_id, date")
+            columns = [column[0] for column in cursor.description]
+
+            if file_format == "csv":
+                writer = csv.writer(output)
+                writer.writerow(columns)
+                for row in iter_rows(cursor, chunk_size):
+                    writer.writerow(row)
+                    count += 1
+            elif file_format == "jsonl":
+                for row in iter_rows(cursor, chunk_size):
+                    output.write(json.dumps(dict(zip(columns, row))) + "\n")
+                    count += 1
+            else:
+                print(f"Unknown export format '{file_format}', expected 'csv' or 'jsonl'")
+            cursor.close()
+    except sqlite3.Error as ex:
+        print(f"Error exporting weather data: {ex}")
+    except OSError as ex:
+        print(f"Error writing export file {output_path}: {ex}")
+    return count
+
+# Export from the command line: python Export.py <output_file> [csv|jsonl]
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python Export.py <output_file> [csv|jsonl]")
+    else:
+        output_path = sys.argv[1]
+        file_format = sys.argv[2] if len(sys.argv) == 3 else ("jsonl" if output_path.endswith(".jsonl") else "csv")
+        exported = export_weather_data(output_path, file_format)
+        print(f"Exported {exported} rows to {output_path}")
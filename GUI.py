@@ -1,135 +1,187 @@
 import sqlite3
+import Analytics
+from Database import DATABASE_PATH
 import tkinter as tk
-from tkinter import messagebox, scrolledtext
+from tkinter import messagebox, scrolledtext, ttk
+from QueryWorkers import QueryWorkerPool
 
-# Function to fetch all countries
-def select_all_countries(connection):
+# How often the GUI checks for finished background queries (about 60 times a second)
+POLL_INTERVAL_MS = 16
+
+# Number of rows loaded into the results table at a time
+PAGE_SIZE = 200
+
+# Class holding one page of rows for the results table, and the key to continue from (None on the last page)
+class Page:
+    def __init__(self, columns, rows, next_key, empty_message):
+        self.columns = columns
+        self.rows = rows
+        self.next_key = next_key
+        self.empty_message = empty_message
+
+# Function to build a page from fetched rows, using the last row's key column to continue from
+def make_page(columns, rows, key_index, limit, empty_message):
+    next_key = rows[-1][key_index] if len(rows) == limit else None
+    return Page(columns, rows, next_key, empty_message)
+
+# The query functions format the results of the cached Analytics queries as text or as a page of table rows,
+# and turn database errors into a message for the output box
+
+# Function to fetch a page of countries, continuing after the given country id
+def select_all_countries(connection, after=None, limit=PAGE_SIZE):
     try:
-        query = "SELECT * FROM countries"
-        cursor = connection.cursor()
-        cursor.execute(query)
-        result = ""
-        for row in cursor.fetchall():
-            result += f"Country Id: {row['id']} -- Country Name: {row['name']} -- Country Timezone: {row['timezone']}\n"
-        cursor.close()
-        return result if result else "No countries found."
+        rows = [(row['id'], row['name'], row['timezone']) for row in Analytics.countries(connection, after, limit)]
+        return make_page(["Country Id", "Country Name", "Country Timezone"], rows, 0, limit, "No countries found.")
     except sqlite3.OperationalError as ex:
         return f"Error executing query: {ex}"
 
-# Function to fetch all cities
-def select_all_cities(connection):
+# Function to fetch a page of cities, continuing after the given city id
+def select_all_cities(connection, after=None, limit=PAGE_SIZE):
     try:
-        query = "SELECT * FROM cities"
-        cursor = connection.cursor()
-        cursor.execute(query)
-        result = ""
-        for row in cursor.fetchall():
-            result += f"City ID: {row['id']}, City Name: {row['name']}, Longitude: {row['longitude']}, Latitude: {row['latitude']}, Country ID: {row['country_id']}\n"
-        cursor.close()
-        return result if result else "No cities found."
+        rows = [(row['id'], row['name'], row['longitude'], row['latitude'], row['country_id'])
+                for row in Analytics.cities(connection, after, limit)]
+        return make_page(["City ID", "City Name", "Longitude", "Latitude", "Country ID"], rows, 0, limit, "No cities found.")
     except sqlite3.OperationalError as ex:
         return f"Error executing query: {ex}"
 
 # Function to calculate average annual temperature for a specific city and year
 def average_annual_temperature(connection, city_id, year):
     try:
-        query = """
-        SELECT c.name AS city_name, AVG(d.mean_temp) AS avg_temp
-        FROM daily_weather_entries d
-        JOIN cities c ON d.city_id = c.id
-        WHERE d.city_id = ? AND strftime('%Y', d.date) = ?
-        GROUP BY c.name
-        """
-        cursor = connection.cursor()
-        cursor.execute(query, (city_id, str(year)))
-        result = cursor.fetchone()
-        cursor.close()
+        result = Analytics.average_annual_temperature(connection, city_id, year)
         if result:
             return f"The Average Annual Temperature for city {result['city_name']} in {year}: {round(result['avg_temp'], 2)} degrees Celsius"
         return "No data found for this city and year."
     except sqlite3.OperationalError as ex:
         return f"Error executing query: {ex}"
 
-# Function to calculate average 7-day precipitation for a specific city and start date
+# Function to calculate average precipitation over the 7 days starting at a specific date for a city
 def average_seven_day_precipitation(connection, city_id, start_date):
     try:
-        query = """
-        SELECT c.name AS city_name, AVG(d.precipitation) AS avg_precip
-        FROM daily_weather_entries d
-        JOIN cities c ON d.city_id = c.id
-        WHERE d.city_id = ? AND d.date >= date(?, '-7 day')
-        GROUP BY c.name
-        """
-        cursor = connection.cursor()
-        cursor.execute(query, (city_id, start_date))
-        result = cursor.fetchone()
-        cursor.close()
+        result = Analytics.average_seven_day_precipitation(connection, city_id, start_date)
         if result:
             return f"Average 7-Day Precipitation for city {result['city_name']}, starting from {start_date}: {round(result['avg_precip'], 2)} mm"
         return "No data found for this city and date range."
     except sqlite3.OperationalError as ex:
         return f"Error executing query: {ex}"
 
-# Function to calculate average mean temperature by city within a date range
-def average_mean_temp_by_city(connection, date_from, date_to):
+# Function to calculate average mean temperature by city within a date range, a page of cities at a time
+def average_mean_temp_by_city(connection, date_from, date_to, after=None, limit=PAGE_SIZE):
     try:
-        query = """
-        SELECT c.name AS city_name, AVG(d.mean_temp) AS avg_temp
-        FROM daily_weather_entries d
-        JOIN cities c ON d.city_id = c.id
-        WHERE d.date BETWEEN ? AND ?
-        GROUP BY c.name
-        """
-        cursor = connection.cursor()
-        cursor.execute(query, (date_from, date_to))
-        result = ""
-        for row in cursor.fetchall():
-            result += f"Average Mean Temperature for city {row['city_name']} from {date_from} to {date_to}: {round(row['avg_temp'], 2)} degrees Celsius\n"
-        cursor.close()
-        return result if result else "No data found in this date range."
+        rows = [(row['city_name'], round(row['avg_temp'], 2))
+                for row in Analytics.average_mean_temp_by_city(connection, date_from, date_to, after, limit)]
+        return make_page(["City Name", f"Average Mean Temperature {date_from} to {date_to} (°C)"], rows, 0, limit,
+                         "No data found in this date range.")
     except sqlite3.OperationalError as ex:
         return f"Error executing query: {ex}"
 
-# Function to calculate average annual precipitation by country
-def average_annual_precipitation_by_country(connection, year):
+# Function to calculate average annual precipitation by country, a page of countries at a time
+def average_annual_precipitation_by_country(connection, year, after=None, limit=PAGE_SIZE):
     try:
-        query = """
-        SELECT co.name AS country_name, AVG(d.precipitation) AS avg_precip
-        FROM cities ci
-        JOIN countries co ON ci.country_id = co.id
-        JOIN daily_weather_entries d ON ci.id = d.city_id
-        WHERE strftime('%Y', d.date) = ?
-        GROUP BY co.name
-        """
-        cursor = connection.cursor()
-        cursor.execute(query, (str(year),))
-        result = ""
-        for row in cursor.fetchall():
-            result += f"Average Annual Precipitation for country {row['country_name']} in {year}: {round(row['avg_precip'], 2)} mm\n"
-        cursor.close()
-        return result if result else "No data found for this year."
+        rows = [(row['country_name'], round(row['avg_precip'], 2))
+                for row in Analytics.average_annual_precipitation_by_country(connection, year, after, limit)]
+        return make_page(["Country Name", f"Average Annual Precipitation {year} (mm)"], rows, 0, limit,
+                         "No data found for this year.")
     except sqlite3.OperationalError as ex:
         return f"Error executing query: {ex}"
 
+# Function run on a worker thread to fetch a text result or a page of table rows
+def run_query(connection, query_func, args, after, append):
+    if after is None:
+        return append, query_func(connection, *args)
+    return append, query_func(connection, *args, after=after)
+
 # Main GUI Function
 def create_gui():
+    # Which paged query the table is showing, and where the next page starts
+    table_state = {"query": None, "next_key": None, "loading": False}
+
+    # Run the query on a background worker so the window stays responsive; a newer click cancels an older query
     def show_result(query_func, *args):
-        try:
-            with sqlite3.connect('CIS4044-N-SDI-OPENMETEO-PARTIAL.db') as connection:
-                connection.row_factory = sqlite3.Row  # Ensure rows are returned as dictionaries
-                result = query_func(connection, *args)
-                output_text.delete(1.0, tk.END)
-                output_text.insert(tk.END, result)
-        except sqlite3.Error as ex:
-            messagebox.showerror("Database Error", f"Error connecting to database: {ex}")
+        table_state.update(query=(query_func, args), next_key=None, loading=True)
+        workers.submit(run_query, query_func, args, None, False)
+        status_label.config(text="Running query...")
+        progress.start(10)
+
+    # Fetch the next page of the current table when the user scrolls near the bottom
+    def load_next_page():
+        if table_state["loading"] or table_state["next_key"] is None:
+            return
+        query_func, args = table_state["query"]
+        table_state["loading"] = True
+        workers.submit(run_query, query_func, args, table_state["next_key"], True)
+        status_label.config(text="Loading more rows...")
+        progress.start(10)
+
+    def on_table_scroll(first, last):
+        table_scrollbar.set(first, last)
+        if float(last) > 0.9:
+            load_next_page()
+
+    def show_text(text):
+        table_frame.pack_forget()
+        output_text.pack(padx=10, pady=10, before=progress)
+        output_text.delete(1.0, tk.END)
+        output_text.insert(tk.END, text)
+
+    def show_page(page, append):
+        if not append:
+            if not page.rows:
+                show_text(page.empty_message)
+                return
+            output_text.pack_forget()
+            table_frame.pack(padx=10, pady=10, fill=tk.BOTH, expand=True, before=progress)
+            table.delete(*table.get_children())
+            table.configure(columns=list(range(len(page.columns))))
+            for index, column in enumerate(page.columns):
+                table.heading(index, text=column)
+                table.column(index, width=max(80, 8 * len(column)), anchor=tk.W)
+        for row in page.rows:
+            table.insert("", tk.END, values=row)
+        table_state["next_key"] = page.next_key
+
+    # Check for a finished query on the Tk main thread, about 60 times a second
+    def poll_results():
+        finished = workers.poll()
+        if finished is not None:
+            result, error = finished
+            table_state["loading"] = False
+            progress.stop()
+            status_label.config(text="")
+            if error is not None:
+                messagebox.showerror("Database Error", f"Error connecting to database: {error}")
+            else:
+                append, result = result
+                if isinstance(result, Page):
+                    show_page(result, append)
+                else:
+                    show_text(result)
+        window.after(POLL_INTERVAL_MS, poll_results)
+
+    def on_close():
+        workers.shutdown()
+        window.destroy()
 
     window = tk.Tk()
     window.title("Weather Data GUI")
+    workers = QueryWorkerPool(DATABASE_PATH)
 
-    # Text area to display results
+    # Text area to display single results
     output_text = scrolledtext.ScrolledText(window, width=80, height=20)
     output_text.pack(padx=10, pady=10)
 
+    # Table to display row results; rows are loaded a page at a time as the user scrolls
+    table_frame = tk.Frame(window)
+    table = ttk.Treeview(table_frame, show="headings", height=20)
+    table_scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=table.yview)
+    table.configure(yscrollcommand=on_table_scroll)
+    table.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+    table_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+    # Progress indicator shown while a query is running
+    progress = ttk.Progressbar(window, mode="indeterminate", length=200)
+    progress.pack(pady=2)
+    status_label = tk.Label(window, text="")
+    status_label.pack()
     # Buttons for each function
     btn_countries = tk.Button(window, text="All Countries", command=lambda: show_result(select_all_countries))
     btn_countries.pack(pady=5)
@@ -149,6 +201,8 @@ def create_gui():
     btn_precip_country = tk.Button(window, text="Average Annual Precipitation by Country", command=lambda: show_result(average_annual_precipitation_by_country, 2020))
     btn_precip_country.pack(pady=5)
 
+    window.protocol("WM_DELETE_WINDOW", on_close)
+    window.after(POLL_INTERVAL_MS, poll_results)
     window.mainloop()
 
 # Run the GUI
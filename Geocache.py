@@ -0,0 +1,126 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from Database import DATABASE_PATH
+
+# How long successful and failed lookups stay valid in the on-disk cache, in seconds
+POSITIVE_TTL = 90 * 24 * 60 * 60
+NEGATIVE_TTL = 24 * 60 * 60
+
+# Marker stored in the in-process cache for lookups that failed
+_NOT_FOUND = object()
+
+# Exception a geocode function raises when the service could not be reached or did not answer,
+# as opposed to answering that the city is unknown; such failures are never cached
+class GeocodeUnavailable(Exception):
+    pass
+
+# Function to normalise a city name and country into a cache key
+def normalize_key(city_name, country=None):
+    name_key = " ".join(city_name.split()).casefold()
+    country_key = "" if country is None else " ".join(str(country).split()).casefold()
+    return name_key, country_key
+
+# Class to cache geocoding results in memory, in the cities table and in a dedicated cache table
+class GeocodeCache:
+    def __init__(self, db_path=DATABASE_PATH, positive_ttl=POSITIVE_TTL, negative_ttl=NEGATIVE_TTL, lru_size=4096):
+        self.db_path = db_path
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.lru_size = lru_size
+        self.lru = OrderedDict()
+        self.lock = threading.Lock()
+        self.table_ready = False
+
+    def _ensure_table(self, conn):
+        if not self.table_ready:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS geocode_cache (
+                    name_key TEXT NOT NULL,
+                    country_key TEXT NOT NULL,
+                    latitude REAL,
+                    longitude REAL,
+                    found INTEGER NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    PRIMARY KEY (name_key, country_key)
+                )
+            ''')
+            self.table_ready = True
+
+    def _lru_get(self, key):
+        with self.lock:
+            if key in self.lru:
+                self.lru.move_to_end(key)
+                return self.lru[key]
+        return None
+
+    def _lru_put(self, key, value):
+        with self.lock:
+            self.lru[key] = value
+            self.lru.move_to_end(key)
+            while len(self.lru) > self.lru_size:
+                self.lru.popitem(last=False)
+
+    # Look the city up in the cities table, which already stores coordinates for cities we have ingested
+    def _from_cities_table(self, conn, city_name, country):
+        if isinstance(country, int):
+            cursor = conn.execute("SELECT latitude, longitude FROM cities WHERE name = ? AND country_id = ?", (city_name, country))
+        else:
+            cursor = conn.execute("SELECT latitude, longitude FROM cities WHERE name = ?", (city_name,))
+        row = cursor.fetchone()
+        if row and row[0] is not None and row[1] is not None:
+            return [row[0], row[1]]
+        return None
+
+    def _from_cache_table(self, conn, key):
+        row = conn.execute(
+            "SELECT latitude, longitude, found, fetched_at FROM geocode_cache WHERE name_key = ? AND country_key = ?", key
+        ).fetchone()
+        if row is None:
+            return None
+        latitude, longitude, found, fetched_at = row
+        ttl = self.positive_ttl if found else self.negative_ttl
+        if time.time() - fetched_at > ttl:
+            return None
+        return [latitude, longitude] if found else _NOT_FOUND
+
+    def _store(self, conn, key, lat_lon):
+        found = 1 if lat_lon else 0
+        latitude, longitude = lat_lon if lat_lon else (None, None)
+        conn.execute('''
+            INSERT OR REPLACE INTO geocode_cache (name_key, country_key, latitude, longitude, found, fetched_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (key[0], key[1], latitude, longitude, found, time.time()))
+
+    # Return [lat, lon] for the city, only calling geocode_func when no cached answer is available
+    def lookup(self, city_name, country, geocode_func):
+        key = normalize_key(city_name, country)
+        cached = self._lru_get(key)
+        if cached is not None:
+            return None if cached is _NOT_FOUND else cached
+
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                self._ensure_table(conn)
+                cached = self._from_cities_table(conn, city_name, country) or self._from_cache_table(conn, key)
+        except sqlite3.DatabaseError as e:
+            print(f"Database error occurred while reading the geocode cache for {city_name}: {e}")
+            cached = None
+
+        if cached is None:
+            try:
+                lat_lon = geocode_func(city_name)
+            except GeocodeUnavailable as e:
+                print(f"Geocoding is unavailable for {city_name}, not caching the failure: {e}")
+                return None
+            cached = list(lat_lon) if lat_lon else _NOT_FOUND
+            try:
+                with sqlite3.connect(self.db_path) as conn:
+                    self._ensure_table(conn)
+                    self._store(conn, key, lat_lon)
+            except sqlite3.DatabaseError as e:
+                print(f"Database error occurred while writing the geocode cache for {city_name}: {e}")
+
+        self._lru_put(key, cached)
+        return None if cached is _NOT_FOUND else cached
@@ -1,15 +1,23 @@
-import requests
 import sqlite3
 import geocoder
 from datetime import datetime
+import Network
+from Database import DATABASE_PATH, FETCH_CHUNK_SIZE, UPSERT_DAILY_WEATHER_SQL, stream_query
+from Geocache import GeocodeCache, GeocodeUnavailable
+from OpenMeteo import ARCHIVE_API_URL, build_archive_url, decode_json, fetch_weather_data_batch
+from QueryCache import bump_generations
+from Rollups import refresh_rollups
+from Shards import ShardRouter, use_shards
+from Sync import run_incremental_sync
+from WeatherSchema import daily_rows, write_hourly_data
 
 # Define the function to retrieve data from Open-Meteo API
-def fetch_weather_data(city, lat, lon, start_date, end_date):
-    url = "https://archive-api.open-meteo.com/v1/archive?latitude=52.52&longitude=13.41&start_date=2024-12-20&end_date=2025-01-03&daily=temperature_2m_max,temperature_2m_min,temperature_2m_mean,apparent_temperature_max,precipitation_sum&timezone=GMT"
-    response = requests.get(url)
+def fetch_weather_data(city, lat, lon, start_date, end_date, api_url=ARCHIVE_API_URL):
+    url = build_archive_url(lat, lon, start_date, end_date, api_url=api_url)
+    response = Network.get(url)
     
     if response.status_code == 200:
-        data = response.json()  
+        data = decode_json(response.content)  
         return data["daily"]
     else:
         print(f"Error fetching data for {city}: {response.status_code}")
@@ -31,46 +39,55 @@ def get_or_insert_city(city_name, lat, lon, country_id, conn):
             INSERT INTO cities (name, latitude, longitude, country_id) 
             VALUES (?, ?, ?, ?)
         ''', (city_name, lat, lon, country_id))
-        conn.commit()
         
-        # Fetch and return the newly inserted city_id
-        cursor.execute("SELECT id FROM cities WHERE name = ?", (city_name,))
-        city_id = cursor.fetchone()
-        return city_id[0]
+        # Return the id of the new row; the caller commits it together with the weather data
+        return cursor.lastrowid
 
-# Function to insert data into the database
+# Function to insert data into the database, which run_incremental_sync has already migrated with ensure_schema
 def insert_weather_data(city_name, daily_data, lat, lon, country_id):
-    with sqlite3.connect('CIS4044-N-SDI-OPENMETEO-PARTIAL.db') as conn:
+    with sqlite3.connect(DATABASE_PATH) as conn:
         cursor = conn.cursor()
+        # Sharded databases (see Shards.py) keep their daily rows in the shard files
+        shard_router = ShardRouter.for_connection(conn)
 
         # Get or insert the city and retrieve the city_id
         city_id = get_or_insert_city(city_name, lat, lon, country_id, conn)
 
-        # Inserting each day's data into the database
-        data_to_insert = [
-            (city_id, daily_data["time"][i], daily_data["temperature_2m_min"][i], 
-             daily_data["temperature_2m_max"][i], daily_data["temperature_2m_mean"][i],
-             daily_data["precipitation_sum"][i])
-            for i in range(len(daily_data["time"]))
-        ]
+        write_hourly_data(conn, city_id, daily_data)
+        if shard_router:
+            # Upsert each day into its shard, refreshing the rollups and generations, one transaction per group of shards
+            shard_router.write_rows(conn, daily_rows(city_id, daily_data))
+        else:
+            # Inserting each day's data into the database, updating days that are already stored
+            cursor.executemany(UPSERT_DAILY_WEATHER_SQL, daily_rows(city_id, daily_data))
 
-        cursor.executemany(''' 
-            INSERT INTO daily_weather_entries (city_id, date, min_temp, max_temp, mean_temp, precipitation) 
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', data_to_insert)
+            # Keep the monthly and annual rollups for the affected periods up to date, and invalidate cached query results
+            refresh_rollups(conn, city_id, daily_data["time"])
+            bump_generations(conn, city_id, daily_data["time"])
 
         conn.commit()
 
+# Cache of geocoding results shared by every lookup in this run
+geocode_cache = GeocodeCache()
+
 # Function to get latitude and longitude of a city using geocoder
-def get_lat_lon_from_city(city_name):
-    g = geocoder.arcgis(city_name)  
+# Only an answer from ArcGIS without a match returns None; timeouts, connection and server errors
+# raise GeocodeUnavailable so the cache does not remember them as unknown cities
+def geocode_with_arcgis(city_name):
+    g = Network.call_with_retries(geocoder.arcgis, city_name, session=Network.get_session(), timeout=Network.get_timeout())
     
     if g.ok:
         return g.latlng
+    elif g.status_code != 200:
+        raise GeocodeUnavailable(f"ArcGIS returned status {g.status_code}")
     else:
         print(f"Error: Could not geocode city '{city_name}'")
         return None
 
+# Function to get latitude and longitude of a city, checking the geocode cache before calling ArcGIS
+def get_lat_lon_from_city(city_name, country=None):
+    return geocode_cache.lookup(city_name, country, geocode_with_arcgis)
+
 # List of cities to fetch data for (without lat, lon as they will be fetched dynamically)
 cities = [
     {"city": "Berlin", "country_id": 3},  
@@ -80,32 +97,14 @@ cities = [
 start_date = "2024-11-26"
 end_date = "2024-12-10"
 
-# Fetch and insert data for each city
-for city in cities:
-    print(f"Fetching latitude and longitude for {city['city']}...")
-    lat_lon = get_lat_lon_from_city(city["city"])
-    
-    if lat_lon:
-        lat, lon = lat_lon
-        print(f"Fetching weather data for {city['city']}...")
-        daily_data = fetch_weather_data(city["city"], lat, lon, start_date, end_date)
-        
-        if daily_data:
-            print(f"Inserting data for {city['city']}...")
-            insert_weather_data(city["city"], daily_data, lat, lon, city["country_id"])
-            print(f"Data for {city['city']} inserted successfully!")
-        else:
-            print(f"Failed to fetch weather data for {city['city']}")
-    else:
-        print(f"Skipping {city['city']} due to geocoding failure.")
+# Geocode and fetch only the days each city is missing, several cities per request, and upsert them through a single writer
+run_incremental_sync(cities, fetch_weather_data, insert_weather_data, start_date, end_date, max_workers=8,
+                     requests_per_second=5, batch_fetch_func=fetch_weather_data_batch, geocode_func=get_lat_lon_from_city)
 
 # Function to print all weather data from the database
-def print_weather_data():
-    with sqlite3.connect('CIS4044-N-SDI-OPENMETEO-PARTIAL.db') as conn:
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT * FROM daily_weather_entries") 
-        rows = cursor.fetchall()
-
-        for row in rows:
+def print_weather_data(chunk_size=FETCH_CHUNK_SIZE):
+    with sqlite3.connect(DATABASE_PATH) as conn:
+        # Stream the rows a chunk at a time so the whole table is never held in memory
+        use_shards(conn)
+        for row in stream_query(conn, "SELECT * FROM daily_weather_entries", chunk_size=chunk_size):
             print(row)
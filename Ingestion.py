@@ -0,0 +1,322 @@
+import contextlib
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from OpenMeteo import ARCHIVE_API_URL, MAX_LOCATIONS_PER_REQUEST, chunk_cities, parse_weather_data_batch
+
+# Sentinel placed on the writer queue once all fetches have finished
+_STOP = object()
+
+# Class to space out requests so that each host receives at most N requests per second
+class HostRateLimiter:
+    def __init__(self, requests_per_second=5):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0
+        self.next_allowed = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        if not self.interval:
+            return
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_allowed.get(host, now))
+            self.next_allowed[host] = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+# Class to keep track of how much work an ingestion run has done
+class IngestionStats:
+    def __init__(self):
+        self.cities = 0
+        self.rows = 0
+        self.failures = 0
+        # Seconds spent and items handled per pipeline stage, e.g. "fetch", or "fetch blocked" while its output queue was full
+        self.stage_seconds = {}
+        self.stage_items = {}
+        self.started = time.monotonic()
+        self.finished = None
+        self.lock = threading.Lock()
+
+    def add(self, cities=0, rows=0, failures=0):
+        with self.lock:
+            self.cities += cities
+            self.rows += rows
+            self.failures += failures
+
+    @contextlib.contextmanager
+    def timed(self, stage, items=1):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            seconds = time.monotonic() - start
+            with self.lock:
+                self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+                self.stage_items[stage] = self.stage_items.get(stage, 0) + items
+
+    def elapsed(self):
+        end = self.finished if self.finished is not None else time.monotonic()
+        return max(end - self.started, 1e-9)
+
+    def cities_per_second(self):
+        return self.cities / self.elapsed()
+
+    def rows_per_second(self):
+        return self.rows / self.elapsed()
+
+    def report(self):
+        print(f"Ingested {self.cities} cities ({self.rows} rows, {self.failures} failures) in {round(self.elapsed(), 2)}s: "
+              f"{round(self.cities_per_second(), 2)} cities/s, {round(self.rows_per_second(), 2)} rows/s")
+        for stage, seconds in self.stage_seconds.items():
+            items = self.stage_items[stage]
+            print(f"  {stage}: {round(seconds, 2)}s" + (f" over {items} items" if items else ""))
+
+# Function to fill in the latitude and longitude of a city, geocoding it if needed
+def _resolve_city(city, geocode_func):
+    lat, lon = city.get("lat"), city.get("lon")
+    if (lat is None or lon is None) and geocode_func is not None:
+        print(f"Fetching latitude and longitude for {city['city']}...")
+        lat_lon = geocode_func(city["city"], city.get("country_id"))
+        if not lat_lon:
+            print(f"Skipping {city['city']} due to geocoding failure.")
+            return None
+        lat, lon = lat_lon
+    return dict(city, lat=lat, lon=lon)
+
+# Function to fetch the weather data for one city
+def _fetch_city(city, fetch_func, start_date, end_date, rate_limiter, api_url, geocode_func):
+    resolved = _resolve_city(city, geocode_func)
+    if resolved is None:
+        return [(city, None, None, None)]
+
+    rate_limiter.wait(api_url)
+    print(f"Fetching data for {city['city']}...")
+    daily_data = fetch_func(city["city"], resolved["lat"], resolved["lon"], start_date, end_date, api_url=api_url)
+    return [(city, resolved["lat"], resolved["lon"], daily_data)]
+
+# Function to fetch the weather data for a batch of cities with one request
+def _fetch_batch(batch, batch_fetch_func, start_date, end_date, rate_limiter, api_url, geocode_func):
+    results = []
+    resolved = []
+    for city in batch:
+        resolved_city = _resolve_city(city, geocode_func)
+        if resolved_city is None:
+            results.append((city, None, None, None))
+        else:
+            resolved.append(resolved_city)
+
+    if resolved:
+        rate_limiter.wait(api_url)
+        print(f"Fetching data for {', '.join(city['city'] for city in resolved)}...")
+        daily_list = batch_fetch_func(resolved, start_date, end_date, api_url=api_url)
+        for city, daily_data in zip(resolved, daily_list):
+            results.append((city, city["lat"], city["lon"], daily_data))
+    return results
+
+# Function run by the single writer thread, feeding fetched data into insert_func one city at a time
+def _write_results(results, insert_func, stats):
+    while True:
+        item = results.get()
+        if item is _STOP:
+            return
+        city, lat, lon, daily_data = item
+        try:
+            print(f"Inserting data for {city['city']}...")
+            insert_func(city["city"], daily_data, lat, lon, city["country_id"])
+            stats.add(cities=1, rows=len(daily_data["time"]))
+            print(f"Data for {city['city']} inserted successfully!")
+        except Exception as e:
+            stats.add(failures=1)
+            print(f"An error occurred while processing data for {city['city']}: {e}")
+
+# Function to fetch weather data for many cities concurrently and insert it through a single writer
+# When batch_fetch_func is given, cities are packed batch_size at a time into each request
+# The fetch functions receive api_url as a keyword argument, so a run can be pointed at another server, e.g. a local stub
+def run_ingestion(cities, fetch_func, insert_func, start_date, end_date, max_workers=8,
+                  requests_per_second=5, api_url=ARCHIVE_API_URL, geocode_func=None,
+                  batch_fetch_func=None, batch_size=MAX_LOCATIONS_PER_REQUEST):
+    stats = IngestionStats()
+    rate_limiter = HostRateLimiter(requests_per_second)
+    results = queue.Queue(maxsize=max_workers * 2)
+
+    writer = threading.Thread(target=_write_results, args=(results, insert_func, stats), daemon=True)
+    writer.start()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            if batch_fetch_func is not None:
+                futures = [
+                    executor.submit(_fetch_batch, batch, batch_fetch_func, start_date, end_date, rate_limiter, api_url, geocode_func)
+                    for batch in chunk_cities(cities, batch_size)
+                ]
+            else:
+                futures = [
+                    executor.submit(_fetch_city, city, fetch_func, start_date, end_date, rate_limiter, api_url, geocode_func)
+                    for city in cities
+                ]
+            for future in futures:
+                try:
+                    fetched = future.result()
+                except Exception as e:
+                    stats.add(failures=1)
+                    print(f"An error occurred while fetching weather data: {e}")
+                    continue
+
+                for city, lat, lon, daily_data in fetched:
+                    if daily_data:
+                        results.put((city, lat, lon, daily_data))
+                    else:
+                        stats.add(failures=1)
+                        print(f"Failed to fetch weather data for {city['city']}")
+    finally:
+        results.put(_STOP)
+        writer.join()
+        stats.finished = time.monotonic()
+
+    stats.report()
+    return stats
+
+# Function to put an item on a bounded queue, recording how long the stage was held back by a full queue
+def _put(output, item, stats, stage):
+    with stats.timed(f"{stage} blocked", items=0):
+        output.put(item)
+
+# Function run by each fetcher thread: resolve a batch of cities and download its raw response
+# Errors are counted as failures and the thread moves on, since run_pipeline waits for every stage to drain its queue
+def _fetch_stage(batches, raw, fetch_raw_func, start_date, end_date, rate_limiter, api_url, geocode_func, stats):
+    while True:
+        batch = batches.get()
+        if batch is _STOP:
+            return
+        resolved = []
+        for city in batch:
+            try:
+                resolved_city = _resolve_city(city, geocode_func)
+            except Exception as e:
+                resolved_city = None
+                print(f"An error occurred while geocoding {city.get('city')}: {e}")
+            if resolved_city is None:
+                stats.add(failures=1)
+            else:
+                resolved.append(resolved_city)
+        if not resolved:
+            continue
+
+        try:
+            rate_limiter.wait(api_url)
+            print(f"Fetching data for {', '.join(city['city'] for city in resolved)}...")
+            with stats.timed("fetch"):
+                content = fetch_raw_func(resolved, start_date, end_date, api_url=api_url)
+        except Exception as e:
+            content = None
+            print(f"An error occurred while fetching weather data: {e}")
+        if content is None:
+            stats.add(failures=len(resolved))
+            continue
+        _put(raw, (resolved, content), stats, "fetch")
+
+# Function run by each parser thread: decode raw responses into per-city daily data
+def _parse_stage(raw, parsed, parse_func, stats):
+    while True:
+        item = raw.get()
+        if item is _STOP:
+            return
+        resolved, content = item
+        try:
+            with stats.timed("parse"):
+                daily_list = parse_func(content, len(resolved))
+        except Exception as e:
+            stats.add(failures=len(resolved))
+            print(f"An error occurred while decoding weather data: {e}")
+            continue
+        for city, daily_data in zip(resolved, daily_list):
+            try:
+                item = (city["city"], daily_data, city["lat"], city["lon"], city["country_id"]) if daily_data else None
+            except Exception as e:
+                stats.add(failures=1)
+                print(f"An error occurred while processing data for {city.get('city')}: {e}")
+                continue
+            if item is not None:
+                _put(parsed, item, stats, "parse")
+            else:
+                stats.add(failures=1)
+                print(f"Failed to fetch weather data for {city['city']}")
+
+# Function run by the single writer thread: coalesce cities into write_batch_func calls of about coalesce_rows rows,
+# writing earlier if no new data has arrived for flush_interval seconds
+def _write_stage(parsed, write_batch_func, coalesce_rows, flush_interval, stats):
+    pending = []
+    pending_rows = 0
+
+    def flush():
+        try:
+            with stats.timed("write", items=len(pending)):
+                write_batch_func(list(pending))
+            stats.add(cities=len(pending), rows=pending_rows)
+            print(f"Wrote {len(pending)} cities ({pending_rows} rows)")
+        except Exception as e:
+            stats.add(failures=len(pending))
+            print(f"An error occurred while writing weather data for {len(pending)} cities: {e}")
+
+    while True:
+        try:
+            item = parsed.get(timeout=flush_interval)
+        except queue.Empty:
+            item = None
+        if item is not None and item is not _STOP:
+            try:
+                pending_rows += len(item[1]["time"])
+                pending.append(item)
+            except Exception as e:
+                stats.add(failures=1)
+                print(f"An error occurred while processing data for {item[0]}: {e}")
+        if pending and (item is None or item is _STOP or pending_rows >= coalesce_rows):
+            flush()
+            pending = []
+            pending_rows = 0
+        if item is _STOP:
+            return
+
+# Function to fetch, decode and write weather data in concurrent stages connected by bounded queues:
+# fetch_workers threads download raw responses (batch_size cities per request), parse_workers threads decode them,
+# and a single writer passes (city_name, daily_data, lat, lon, country_id) items to write_batch_func,
+# coalescing many cities into each call so they share one transaction.
+# fetch_raw_func receives api_url as a keyword argument, as in run_ingestion.
+# A full queue blocks the stage feeding it, so fetching slows down when the writer falls behind
+def run_pipeline(cities, fetch_raw_func, write_batch_func, start_date, end_date, fetch_workers=8, parse_workers=1,
+                 requests_per_second=5, api_url=ARCHIVE_API_URL, geocode_func=None, batch_size=MAX_LOCATIONS_PER_REQUEST,
+                 parse_func=parse_weather_data_batch, queue_size=None, coalesce_rows=50000, flush_interval=1.0):
+    stats = IngestionStats()
+    rate_limiter = HostRateLimiter(requests_per_second)
+    queue_size = queue_size or fetch_workers * 2
+    batches = queue.Queue(maxsize=queue_size)
+    raw = queue.Queue(maxsize=queue_size)
+    parsed = queue.Queue(maxsize=queue_size * batch_size)
+
+    fetchers = [threading.Thread(target=_fetch_stage, daemon=True,
+                                 args=(batches, raw, fetch_raw_func, start_date, end_date, rate_limiter, api_url, geocode_func, stats))
+                for _ in range(fetch_workers)]
+    parsers = [threading.Thread(target=_parse_stage, args=(raw, parsed, parse_func, stats), daemon=True)
+               for _ in range(parse_workers)]
+    writer = threading.Thread(target=_write_stage, args=(parsed, write_batch_func, coalesce_rows, flush_interval, stats), daemon=True)
+    for thread in fetchers + parsers + [writer]:
+        thread.start()
+
+    # Shut the stages down in order, so each one drains its input before the next is told to stop
+    try:
+        for batch in chunk_cities(cities, batch_size):
+            batches.put(batch)
+    finally:
+        for stage_queue, threads in ((batches, fetchers), (raw, parsers), (parsed, [writer])):
+            for _ in threads:
+                stage_queue.put(_STOP)
+            for thread in threads:
+                thread.join()
+        stats.finished = time.monotonic()
+
+    stats.report()
+    return stats
@@ -0,0 +1,85 @@
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Default connection pool and retry settings, changed through configure()
+settings = {
+    "pool_size": 16,
+    "connect_timeout": 5,
+    "read_timeout": 30,
+    "max_retries": 4,
+    "backoff_factor": 0.5,
+    "backoff_max": 30,
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+# Function to change the connection pool and retry settings; the shared session is rebuilt on next use
+def configure(**kwargs):
+    global _session
+    unknown = set(kwargs) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown network settings: {', '.join(sorted(unknown))}")
+    with _session_lock:
+        settings.update(kwargs)
+        if _session is not None:
+            _session.close()
+        _session = None
+
+# Function to return the shared keep-alive session used by every network call in the project
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=settings["pool_size"], pool_maxsize=settings["pool_size"], max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+# Function to return the (connect, read) timeout passed to every request
+def get_timeout():
+    return (settings["connect_timeout"], settings["read_timeout"])
+
+# Function to work out how long to wait before the given retry attempt (exponential backoff with full jitter)
+def backoff_delay(attempt, retry_after=None):
+    if retry_after:
+        try:
+            return min(float(retry_after), settings["backoff_max"])
+        except ValueError:
+            pass
+    ceiling = min(settings["backoff_factor"] * (2 ** attempt), settings["backoff_max"])
+    return random.uniform(0, ceiling)
+
+# Function to call func, retrying with backoff on connection errors and retryable status codes
+def call_with_retries(func, *args, **kwargs):
+    attempt = 0
+    while True:
+        try:
+            result = func(*args, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= settings["max_retries"]:
+                raise
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+            continue
+
+        status_code = getattr(result, "status_code", None)
+        if status_code not in RETRY_STATUSES or attempt >= settings["max_retries"]:
+            return result
+
+        headers = getattr(result, "headers", None) or {}
+        time.sleep(backoff_delay(attempt, headers.get("Retry-After")))
+        attempt += 1
+
+# Function to send a GET request through the shared session with timeouts and retries
+def get(url, **kwargs):
+    kwargs.setdefault("timeout", get_timeout())
+    return call_with_retries(get_session().get, url, **kwargs)
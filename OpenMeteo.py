@@ -0,0 +1,113 @@
+import json
+import requests
+import Network
+from urllib.parse import urlencode
+from WeatherSchema import DAILY_COLUMNS, HOURLY_COLUMNS
+
+# JSON decoders in order of preference; orjson and msgspec are optional and much faster on large responses
+def _load_json_decoders():
+    decoders = {"json": json.loads}
+    try:
+        import orjson
+        decoders["orjson"] = orjson.loads
+    except ImportError:
+        pass
+    try:
+        import msgspec
+        decoders["msgspec"] = msgspec.json.decode
+    except ImportError:
+        pass
+    return decoders
+
+JSON_DECODERS = _load_json_decoders()
+
+# Name of the decoder used by decode_json: the fastest one installed
+JSON_DECODER = next(name for name in ("orjson", "msgspec", "json") if name in JSON_DECODERS)
+
+# Function to choose the JSON decoder by name, e.g. "json" to compare against the standard library
+def set_json_decoder(name):
+    global JSON_DECODER
+    if name not in JSON_DECODERS:
+        raise ValueError(f"JSON decoder '{name}' is not installed, expected one of {', '.join(JSON_DECODERS)}")
+    JSON_DECODER = name
+
+# Function to decode a JSON response body (bytes or str) with the selected decoder
+def decode_json(content):
+    return JSON_DECODERS[JSON_DECODER](content)
+
+# Base URL of the Open-Meteo archive API
+ARCHIVE_API_URL = "https://archive-api.open-meteo.com/v1/archive"
+
+# Daily variables requested from the archive API: every variable the database has a column for
+DAILY_VARIABLES = list(DAILY_COLUMNS)
+
+# Hourly variables available for storage; hourly data is only requested when asked for, as it is 24 times larger
+HOURLY_VARIABLES = list(HOURLY_COLUMNS)
+
+# Largest number of locations packed into a single request
+MAX_LOCATIONS_PER_REQUEST = 50
+
+# Function to build the archive URL for one or more locations
+def build_archive_url(lats, lons, start_date, end_date, daily=DAILY_VARIABLES, timezone="GMT", api_url=ARCHIVE_API_URL, hourly=None):
+    if not isinstance(lats, (list, tuple)):
+        lats, lons = [lats], [lons]
+    params = {
+        "latitude": ",".join(str(lat) for lat in lats),
+        "longitude": ",".join(str(lon) for lon in lons),
+        "start_date": start_date,
+        "end_date": end_date,
+        "daily": ",".join(daily),
+        "timezone": timezone,
+    }
+    if hourly:
+        params["hourly"] = ",".join(hourly)
+    return f"{api_url}?{urlencode(params, safe=',')}"
+
+# Function to split a (possibly multi-location) API response into one daily dict per location
+# A location's hourly data, when requested, is attached to its daily dict under "hourly" so it travels with it
+def split_daily_data(data, location_count):
+    # A single location comes back as an object, several locations as a list in request order
+    locations = data if isinstance(data, list) else [data]
+    if len(locations) != location_count:
+        print(f"Expected {location_count} locations in the response but got {len(locations)}")
+        return [None] * location_count
+    daily_list = [location.get("daily") for location in locations]
+    for daily_data, location in zip(daily_list, locations):
+        if daily_data is not None and "hourly" in location:
+            daily_data["hourly"] = location["hourly"]
+    return daily_list
+
+# Function to fetch the undecoded response body for a batch of cities in a single request, or None on failure
+# Pass hourly=HOURLY_VARIABLES (e.g. through functools.partial) to fetch and store hourly data as well
+def fetch_weather_data_batch_raw(cities, start_date, end_date, api_url=ARCHIVE_API_URL, hourly=None):
+    url = build_archive_url([city["lat"] for city in cities], [city["lon"] for city in cities],
+                            start_date, end_date, api_url=api_url, hourly=hourly)
+    names = ", ".join(city["city"] for city in cities)
+    try:
+        response = Network.get(url)
+
+        if response.status_code == 200:
+            return response.content
+        else:
+            print(f"Error fetching data for {names}: {response.status_code}")
+            return None
+    except requests.RequestException as e:
+        print(f"An error occurred while fetching weather data for {names}: {e}")
+        return None
+
+# Function to decode a response body fetched for location_count cities into one daily dict per location
+def parse_weather_data_batch(content, location_count):
+    return split_daily_data(decode_json(content), location_count)
+
+# Function to fetch weather data for a batch of cities in a single request
+# Pass hourly=HOURLY_VARIABLES (e.g. through functools.partial) to fetch and store hourly data as well
+def fetch_weather_data_batch(cities, start_date, end_date, api_url=ARCHIVE_API_URL, hourly=None):
+    content = fetch_weather_data_batch_raw(cities, start_date, end_date, api_url, hourly)
+    if content is None:
+        return [None] * len(cities)
+    return parse_weather_data_batch(content, len(cities))
+
+# Function to split a list of cities into batches of at most batch_size cities
+def chunk_cities(cities, batch_size=MAX_LOCATIONS_PER_REQUEST):
+    for i in range(0, len(cities), batch_size):
+        yield cities[i:i + batch_size]
@@ -1,5 +1,8 @@
 import sqlite3
+import sys
 import matplotlib.pyplot as plt
+import Reports
+from ReportData import ReportData
 
 # Function to fetch all countries
 def select_all_countries(connection):
@@ -54,165 +57,82 @@ def fetch_min_max_temp_for_city(connection, city_name, start_date, end_date):
     return data if data else (None, None)
 
 # Function to plot average precipitation for a period
-def plot_avg_precipitation(period1_data, period2_data):
-    labels = ['2020-01-01 to 2020-06-30', '2020-07-01 to 2020-12-31']
-    values = [period1_data, period2_data]
-    plt.bar(labels, values, color=['blue', 'green'])
-    plt.xlabel('Period')
-    plt.ylabel('Average Precipitation (mm)')
-    plt.title('Average Precipitation for Two Periods')
-    plt.xticks(rotation=0)  
+def plot_avg_precipitation(period1_data, period2_data, periods=Reports.DEFAULT_PERIODS):
+    fig, ax = plt.subplots()
+    Reports.draw_avg_precipitation(ax, periods, [period1_data, period2_data])
     plt.show()
 
 # Function to plot min and max temperatures for a city
 def plot_min_max_temp(city_data, city_name):
-    min_temps = [city_data[0]]
-    max_temps = [city_data[1]]
-    
-    plt.bar(city_name, min_temps, width=0.4, label='Min Temp (°C)', color='blue', align='center')
-    plt.bar(city_name, max_temps, width=0.4, label='Max Temp (°C)', color='red', align='edge')
-    plt.xlabel('City')
-    plt.ylabel('Temperature (°C)')
-    plt.title(f'Min and Max Temperatures for {city_name}')
-    plt.legend()
-    plt.xticks(rotation=0)  
+    fig, ax = plt.subplots()
+    Reports.draw_min_max_temp(ax, city_name, city_data)
     plt.show()
 
-# Function to plot the number of cities in each country
-def plot_cities_per_country(countries, cities):
-    city_count = {country['name']: 0 for country in countries}
-    for city in cities:
-        country_id = city['country_id']
-        for country in countries:
-            if country['id'] == country_id:
-                city_count[country['name']] += 1
-
-    countries = list(city_count.keys())
-    counts = list(city_count.values())
-
-    plt.bar(countries, counts, color='orange')
-    plt.xlabel('Country')
-    plt.ylabel('Number of Cities')
-    plt.title('Number of Cities in Each Country')
-    plt.xticks(rotation=0)  
+# Function to plot the number of cities in each country, counted in SQL
+def plot_cities_per_country(report_data):
+    city_count = report_data.cities_per_country()
+
+    fig, ax = plt.subplots()
+    Reports.draw_cities_per_country(ax, city_count)
     plt.show()
 
 # Function to plot temperature variations for all cities
-def plot_temp_variations_for_all_cities(cities):
+def plot_temp_variations_for_all_cities(report_data, cities, period=Reports.DEFAULT_PERIODS[0]):
     city_names = [city['name'] for city in cities]
-    min_temps = []
-    max_temps = []
-
-    for city in cities:
-        city_data = fetch_min_max_temp_for_city(connection, city['name'], '2020-01-01', '2020-06-30')
-        min_temps.append(city_data[0])
-        max_temps.append(city_data[1])
-
-    plt.plot(city_names, min_temps, label='Min Temp (°C)', marker='o', color='blue')
-    plt.plot(city_names, max_temps, label='Max Temp (°C)', marker='x', color='red')
-    plt.xlabel('City')
-    plt.ylabel('Temperature (°C)')
-    plt.title('Temperature Variations for All Cities')
-    plt.xticks(rotation=0)  
-    plt.legend()
+    min_max = report_data.min_max_by_city(*period)
+    min_temps = [min_max.get(city['id'], (None, None))[0] for city in cities]
+    max_temps = [min_max.get(city['id'], (None, None))[1] for city in cities]
+
+    fig, ax = plt.subplots()
+    Reports.draw_temp_variations(ax, city_names, min_temps, max_temps)
     plt.show()
 
 # Function to plot the average temperature for all cities
-def plot_avg_temp_for_all_cities(cities):
+def plot_avg_temp_for_all_cities(report_data, cities):
     city_names = [city['name'] for city in cities]
-    avg_temps = []
-
-    for city in cities:
-        query = """
-        SELECT AVG(mean_temp) FROM daily_weather_entries
-        WHERE city_id = ?
-        """
-        cursor = connection.cursor()
-        cursor.execute(query, (city['id'],))
-        data = cursor.fetchone()
-        cursor.close()
-        avg_temps.append(data[0] if data[0] is not None else 0)
-
-    plt.bar(city_names, avg_temps, color='purple')
-    plt.xlabel('City')
-    plt.ylabel('Average Temperature (°C)')
-    plt.title('Average Temperature for All Cities')
-    plt.xticks(rotation=0)  
+    avg_temps = report_data.average_temperatures(cities)
+
+    fig, ax = plt.subplots()
+    Reports.draw_avg_temp(ax, city_names, avg_temps)
     plt.show()
 
-# Function to plot temperature variation across two periods for a city
-def plot_temp_variation_for_periods(connection, city_name, period1_start, period1_end, period2_start, period2_end):
-    min_temp_period1 = fetch_min_max_temp_for_city(connection, city_name, period1_start, period1_end)[0]
-    max_temp_period1 = fetch_min_max_temp_for_city(connection, city_name, period1_start, period1_end)[1]
-    min_temp_period2 = fetch_min_max_temp_for_city(connection, city_name, period2_start, period2_end)[0]
-    max_temp_period2 = fetch_min_max_temp_for_city(connection, city_name, period2_start, period2_end)[1]
-
-    labels = [f"{city_name} - 2020-01-01 to 2020-06-30", f"{city_name} - 2020-07-01 to 2020-12-31"]
-    min_temps = [min_temp_period1, min_temp_period2]
-    max_temps = [max_temp_period1, max_temp_period2]
-
-    x = range(len(labels))
-    plt.barh(x, min_temps, height=0.4, label='Min Temp (°C)', color='blue', align='center')
-    plt.barh(x, max_temps, height=0.4, label='Max Temp (°C)', color='red', align='edge')
-
-    plt.yticks(x, labels, fontsize=8)  
-    plt.xlabel('Temperature (°C)')
-    plt.ylabel('Period')
-    plt.title(f'Temperature Variation for {city_name}')
-    plt.legend()
+# Function to plot temperature variation across periods for a city, fetched with one query for all periods
+def plot_temp_variation_for_periods(report_data, city_name, periods=Reports.DEFAULT_PERIODS):
+    statistics = report_data.period_statistics(city_name, periods)
+    min_max_per_period = [(period["min_temp"], period["max_temp"]) for period in statistics]
+
+    fig, ax = plt.subplots()
+    Reports.draw_temp_variation_for_periods(ax, city_name, periods, min_max_per_period)
     plt.tight_layout()  
     plt.show()
 
 # Function to add Box Plot for Temperature Variations
-def plot_box_plot(cities):
+def plot_box_plot(report_data, cities):
     city_names = [city['name'] for city in cities]
-    temperature_data = []
-
-    for city in cities:
-        query = """
-        SELECT mean_temp FROM daily_weather_entries
-        WHERE city_id = ?
-        """
-        cursor = connection.cursor()
-        cursor.execute(query, (city['id'],))
-        data = cursor.fetchall()
-        cursor.close()
-        temps = [entry[0] for entry in data if entry[0] is not None]
-        temperature_data.append(temps)
-
-    plt.boxplot(temperature_data, labels=city_names)
-    plt.xlabel('City')
-    plt.ylabel('Temperature (°C)')
-    plt.title('Temperature Distribution for Each City')
-    plt.xticks(rotation=0)  
+    temperatures = report_data.temperatures_by_city()
+    temperature_data = [temperatures.get(city['id'], []) for city in cities]
+
+    fig, ax = plt.subplots()
+    Reports.draw_box_plot(ax, city_names, temperature_data)
     plt.show()
 
 # Function to add Pie Chart for Distribution of Average Temperatures
-def plot_pie_chart(countries, cities):
-    city_avg_temps = []
-    city_names = []
-    
-    for city in cities:
-        query = """
-        SELECT AVG(mean_temp) FROM daily_weather_entries
-        WHERE city_id = ?
-        """
-        cursor = connection.cursor()
-        cursor.execute(query, (city['id'],))
-        data = cursor.fetchone()
-        cursor.close()
-        
-        avg_temp = data[0] if data[0] is not None else 0
-        city_avg_temps.append(avg_temp)
-        city_names.append(city['name'])
-
-    plt.pie(city_avg_temps, labels=city_names, autopct='%1.1f%%', startangle=90)
-    plt.title('Distribution of Average Temperatures Across Cities')
-    plt.axis('equal')  
+def plot_pie_chart(report_data, countries, cities):
+    # Same averages as plot_avg_temp_for_all_cities, served from the report data cache
+    city_avg_temps = report_data.average_temperatures(cities)
+    city_names = [city['name'] for city in cities]
+
+    fig, ax = plt.subplots()
+    Reports.draw_pie_chart(ax, city_names, city_avg_temps)
     plt.show()
 
 # Main function to execute all tasks
+# Run with --report <output_dir> to render every chart to PNG files without a display instead (see Reports.py)
 if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--report":
+        paths = Reports.render_reports(sys.argv[2])
+        print(f"Rendered {len(paths)} charts to {sys.argv[2]}")
+        sys.exit()
     try:
         # Open connection to the database
         with sqlite3.connect('CIS4044-N-SDI-OPENMETEO-PARTIAL.db') as connection:
@@ -222,6 +142,9 @@ if __name__ == "__main__":
             countries = select_all_countries(connection)
             cities = select_all_cities(connection)
 
+            # Shared per-city aggregates, fetched once per report run
+            report_data = ReportData(connection)
+
             # Generate plots
             avg_precip_period1 = fetch_avg_precipitation_for_period(connection, '2020-01-01', '2020-06-30')
             avg_precip_period2 = fetch_avg_precipitation_for_period(connection, '2020-07-01', '2020-12-31')
@@ -233,22 +156,22 @@ if __name__ == "__main__":
             plot_min_max_temp(city_temp, city_name)
 
             # Plot cities per country
-            plot_cities_per_country(countries, cities)
+            plot_cities_per_country(report_data)
 
             # Plot temperature variations for all cities
-            plot_temp_variations_for_all_cities(cities)
+            plot_temp_variations_for_all_cities(report_data, cities)
 
             # Plot average temperature for all cities
-            plot_avg_temp_for_all_cities(cities)
+            plot_avg_temp_for_all_cities(report_data, cities)
 
             # Plot temperature variation for periods
-            plot_temp_variation_for_periods(connection, 'Middlesbrough', '2020-01-01', '2020-06-30', '2020-07-01', '2020-12-31')
+            plot_temp_variation_for_periods(report_data, 'Middlesbrough', [('2020-01-01', '2020-06-30'), ('2020-07-01', '2020-12-31')])
 
             # Plot Box Plot
-            plot_box_plot(cities)
+            plot_box_plot(report_data, cities)
 
             # Plot Pie Chart
-            plot_pie_chart(countries, cities)
+            plot_pie_chart(report_data, countries, cities)
 
     except sqlite3.Error as ex:
         print(f"Error connecting to database: {ex}")
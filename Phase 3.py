@@ -1,15 +1,25 @@
+import functools
 import requests
 import sqlite3
 from datetime import datetime
+import Network
+from Database import DATABASE_PATH, FETCH_CHUNK_SIZE, UPSERT_DAILY_WEATHER_SQL, BulkLoader, stream_query
+from Ingestion import run_pipeline
+from OpenMeteo import ARCHIVE_API_URL, HOURLY_VARIABLES, build_archive_url, decode_json, fetch_weather_data_batch, fetch_weather_data_batch_raw
+from QueryCache import bump_generations
+from Rollups import refresh_rollups
+from Shards import ShardRouter, use_shards
+from Sync import run_incremental_sync
+from WeatherSchema import daily_rows, write_hourly_data
 
 # Define the function to retrieve weather data from Open-Meteo API
-def fetch_weather_data(city, lat, lon, start_date, end_date):
+def fetch_weather_data(city, lat, lon, start_date, end_date, api_url=ARCHIVE_API_URL):
     try:
-        url = "https://archive-api.open-meteo.com/v1/archive?latitude=52.52&longitude=13.41&start_date=2024-12-20&end_date=2025-01-03&daily=temperature_2m_max,temperature_2m_min,temperature_2m_mean,apparent_temperature_max,precipitation_sum&timezone=GMT"
-        response = requests.get(url)
+        url = build_archive_url(lat, lon, start_date, end_date, api_url=api_url)
+        response = Network.get(url)
         
         if response.status_code == 200:
-            data = response.json()
+            data = decode_json(response.content)
             return data["daily"]
         else:
             print(f"Error fetching data for {city}: {response.status_code}")
@@ -35,21 +45,20 @@ def get_or_insert_city(city_name, lat, lon, country_id, conn):
                 INSERT INTO cities (name, latitude, longitude, country_id)
                 VALUES (?, ?, ?, ?)
             ''', (city_name, lat, lon, country_id))
-            conn.commit()
             
-            # Fetch and return the newly inserted city_id
-            cursor.execute("SELECT id FROM cities WHERE name = ?", (city_name,))
-            city_id = cursor.fetchone()
-            return city_id[0]
+            # Return the id of the new row; the caller commits it together with the weather data
+            return cursor.lastrowid
     except sqlite3.DatabaseError as e:
         print(f"Database error occurred while handling city {city_name}: {e}")
         return None
 
-# Function to insert weather data into the database
+# Function to insert weather data into the database, which run_incremental_sync has already migrated with ensure_schema
 def insert_weather_data(city_name, daily_data, lat, lon, country_id):
     try:
-        with sqlite3.connect('CIS4044-N-SDI-OPENMETEO-PARTIAL.db') as conn:
+        with sqlite3.connect(DATABASE_PATH) as conn:
             cursor = conn.cursor()
+            # Sharded databases (see Shards.py) keep their daily rows in the shard files
+            shard_router = ShardRouter.for_connection(conn)
 
             # Get or insert the city and retrieve the city_id
             city_id = get_or_insert_city(city_name, lat, lon, country_id, conn)
@@ -58,18 +67,17 @@ def insert_weather_data(city_name, daily_data, lat, lon, country_id):
                 print(f"Failed to retrieve or insert city {city_name}. Skipping weather data insertion.")
                 return
 
-            # Insert each day's data into the database
-            data_to_insert = [
-                (city_id, daily_data["time"][i], daily_data["temperature_2m_min"][i], 
-                 daily_data["temperature_2m_max"][i], daily_data["temperature_2m_mean"][i],
-                 daily_data["precipitation_sum"][i])
-                for i in range(len(daily_data["time"]))
-            ]
+            write_hourly_data(conn, city_id, daily_data)
+            if shard_router:
+                # Upsert each day into its shard, refreshing the rollups and generations, one transaction per group of shards
+                shard_router.write_rows(conn, daily_rows(city_id, daily_data))
+            else:
+                # Insert each day's data into the database, updating days that are already stored
+                cursor.executemany(UPSERT_DAILY_WEATHER_SQL, daily_rows(city_id, daily_data))
 
-            cursor.executemany('''
-                INSERT INTO daily_weather_entries (city_id, date, min_temp, max_temp, mean_temp, precipitation)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', data_to_insert)
+                # Keep the monthly and annual rollups for the affected periods up to date, and invalidate cached query results
+                refresh_rollups(conn, city_id, daily_data["time"])
+                bump_generations(conn, city_id, daily_data["time"])
 
             conn.commit()
     except sqlite3.DatabaseError as e:
@@ -86,29 +94,32 @@ cities = [
 start_date = "2024-11-26"
 end_date = "2024-12-10"
 
-# Fetch and insert data for each city
-for city in cities:
-    try:
-        print(f"Fetching data for {city['city']}...")
-        daily_data = fetch_weather_data(city["city"], city["lat"], city["lon"], start_date, end_date)
-        
-        if daily_data:
-            print(f"Inserting data for {city['city']}...")
-            insert_weather_data(city["city"], daily_data, city["lat"], city["lon"], city["country_id"])
-            print(f"Data for {city['city']} inserted successfully!")
-    except Exception as e:
-        print(f"An error occurred while processing data for {city['city']}: {e}")
+# Use the bulk loader (one connection, large transactions) instead of insert_weather_data, for big backfills
+# The bulk load runs as a pipeline: fetching, JSON decoding and writing overlap, and the writer coalesces
+# many cities into each transaction
+bulk_load = False
 
-# Function to print all data from the database
-def print_weather_data():
-    try:
-        with sqlite3.connect('CIS4044-N-SDI-OPENMETEO-PARTIAL.db') as conn:
-            cursor = conn.cursor()
+# Also fetch and store hourly data (see WeatherSchema.HOURLY_COLUMNS); hourly responses are about 24 times larger
+fetch_hourly = False
+hourly = HOURLY_VARIABLES if fetch_hourly else None
+batch_fetch = functools.partial(fetch_weather_data_batch, hourly=hourly)
+batch_fetch_raw = functools.partial(fetch_weather_data_batch_raw, hourly=hourly)
 
-            cursor.execute("SELECT * FROM daily_weather_entries") 
-            rows = cursor.fetchall()
+# Fetch only the days each city is missing, several cities per request, and upsert them through a single writer
+if bulk_load:
+    with BulkLoader() as loader:
+        loader.resolve_city_ids(cities)
+        run_incremental_sync(cities, batch_fetch_raw, loader.write_batch, start_date, end_date, ingest_func=run_pipeline, fetch_workers=8, requests_per_second=5)
+else:
+    run_incremental_sync(cities, fetch_weather_data, insert_weather_data, start_date, end_date, max_workers=8, requests_per_second=5, batch_fetch_func=batch_fetch)
 
-            for row in rows:
+# Function to print all data from the database
+def print_weather_data(chunk_size=FETCH_CHUNK_SIZE):
+    try:
+        with sqlite3.connect(DATABASE_PATH) as conn:
+            # Stream the rows a chunk at a time so the whole table is never held in memory
+            use_shards(conn)
+            for row in stream_query(conn, "SELECT * FROM daily_weather_entries", chunk_size=chunk_size):
                 print(row)
     except sqlite3.DatabaseError as e:
         print(f"Database error occurred while printing weather data: {e}")
@@ -0,0 +1,164 @@
+import functools
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import closing
+
+# Scope bumped by every ingest; results that depend on whole tables (city or country lists) use it
+ALL_DATA_SCOPE = "all"
+
+# Function to return the scope covering every city's data for a year
+def year_scope(year):
+    return f"year:{int(year):04d}"
+
+# Function to return the scope covering one city's data for a year
+def city_year_scope(city_id, year):
+    return f"city:{city_id}:{int(year):04d}"
+
+# Function to return the year scopes touched by an inclusive date range
+def date_range_scopes(date_from, date_to):
+    return [year_scope(year) for year in range(int(date_from[:4]), int(date_to[:4]) + 1)]
+
+# Function to create the data generation table, and the optional persisted cache table
+def ensure_generation_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS data_generations (
+            scope TEXT PRIMARY KEY,
+            generation INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS query_cache_entries (
+            cache_key TEXT PRIMARY KEY,
+            generations TEXT NOT NULL,
+            result BLOB NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+# Function to list the statements that bump the generations affected by new rows for a city
+# Statements use named parameters so they run on both sqlite3 connections and SQLAlchemy sessions
+def generation_bump_statements(city_id, dates):
+    scopes = {ALL_DATA_SCOPE}
+    for year in {date[:4] for date in dates}:
+        scopes.add(year_scope(year))
+        scopes.add(city_year_scope(city_id, year))
+    return [('''
+        INSERT INTO data_generations (scope, generation) VALUES (:scope, 1)
+        ON CONFLICT (scope) DO UPDATE SET generation = generation + 1
+    ''', {"scope": scope}) for scope in sorted(scopes)]
+
+# Function to bump the generations affected by new rows for a city, inside the caller's transaction
+def bump_generations(conn, city_id, dates):
+    for sql, params in generation_bump_statements(city_id, dates):
+        conn.execute(sql, params)
+
+# Function to return the file of a connection's main database, or None for in-memory and temporary databases
+def database_file(connection):
+    for row in connection.execute("PRAGMA database_list").fetchall():
+        if row[1] == "main":
+            return row[2] or None
+    return None
+
+# Class caching query results keyed by database file, function name and arguments
+# Each entry remembers the generation of every data scope it depends on and is discarded once any of them is bumped
+class QueryCache:
+    def __init__(self, max_entries=1024, persist=False):
+        self.max_entries = max_entries
+        self.persist = persist
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _current_generations(self, connection, scopes):
+        placeholders = ", ".join("?" for _ in scopes)
+        try:
+            cursor = connection.execute(f"SELECT scope, generation FROM data_generations WHERE scope IN ({placeholders})", tuple(scopes))
+            found = {row[0]: row[1] for row in cursor.fetchall()}
+            cursor.close()
+        except sqlite3.OperationalError:
+            # The table only exists once data has been ingested with generation tracking
+            found = {}
+        return {scope: found.get(scope, 0) for scope in scopes}
+
+    def _load_persisted(self, connection, key, generations):
+        try:
+            row = connection.execute("SELECT generations, result FROM query_cache_entries WHERE cache_key = ?", (key,)).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        if row is None or json.loads(row[0]) != generations:
+            return None
+        try:
+            return (json.loads(row[1]),)
+        except ValueError:
+            # Entries written by older versions are pickled; they are recomputed and replaced
+            return None
+
+    # Results are written as JSON through a separate connection, so the caller's open transaction is never committed
+    def _store_persisted(self, connection, db_file, key, generations, result):
+        if db_file is None or connection.execute("PRAGMA query_only").fetchone()[0]:
+            return
+        try:
+            value = json.dumps(result)
+            with closing(sqlite3.connect(db_file, timeout=0)) as side_connection, side_connection:
+                side_connection.execute("INSERT OR REPLACE INTO query_cache_entries (cache_key, generations, result) VALUES (?, ?, ?)",
+                                        (key, json.dumps(generations, sort_keys=True), value))
+        except (sqlite3.OperationalError, TypeError, ValueError):
+            # Locked databases and results that are not JSON-serialisable are simply not persisted
+            pass
+
+    # Return the cached result for (name, args) if its scopes are unchanged, otherwise compute and cache it
+    # Results for which cache_if returns False (e.g. error messages) are returned without being cached
+    def get_or_compute(self, connection, name, args, scopes, compute, cache_if=None):
+        key = f"{name}:{json.dumps(args, default=str)}"
+        # Generation counters are per database, so the in-memory key also names the database they were read from
+        db_file = database_file(connection)
+        memory_key = (db_file if db_file is not None else id(connection), key)
+        generations = self._current_generations(connection, scopes)
+
+        with self.lock:
+            entry = self.entries.get(memory_key)
+            if entry is not None and entry[0] == generations:
+                self.entries.move_to_end(memory_key)
+                self.hits += 1
+                return entry[1]
+
+        persisted = self._load_persisted(connection, key, generations) if self.persist else None
+        if persisted is not None:
+            result = persisted[0]
+        else:
+            result = compute()
+            if cache_if is not None and not cache_if(result):
+                return result
+            if self.persist:
+                self._store_persisted(connection, db_file, key, generations, result)
+
+        with self.lock:
+            self.misses += 1
+            self.entries[memory_key] = (generations, result)
+            self.entries.move_to_end(memory_key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+# Cache shared by the query functions of a process
+query_cache = QueryCache()
+
+# Decorator caching a query function(connection, *args) in query_cache
+# scopes_func receives the same arguments (without the connection) and returns the data scopes the result depends on
+def cached(scopes_func, cache=None, cache_if=None):
+    def decorator(query_func):
+        @functools.wraps(query_func)
+        def wrapper(connection, *args, **kwargs):
+            target = cache if cache is not None else query_cache
+            scopes = scopes_func(*args, **kwargs)
+            call_args = [list(args), sorted(kwargs.items())]
+            return target.get_or_compute(connection, f"{query_func.__module__}.{query_func.__qualname__}", call_args, scopes,
+                                         lambda: query_func(connection, *args, **kwargs), cache_if)
+        return wrapper
+    return decorator
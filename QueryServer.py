@@ -0,0 +1,156 @@
+import argparse
+import inspect
+import json
+import multiprocessing
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+from urllib.request import urlopen
+import Analytics
+import Rolling
+from Database import DATABASE_PATH, connect_read_only
+
+# Address the query server listens on; it only serves the local machine by default
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Seconds a request waits for its query before the server answers with an error
+QUERY_TIMEOUT = 30
+
+# Function to turn rows from the Rolling module into JSON objects
+def _rolling_rows(rows):
+    return [dict(zip(("city_id", "date", "rolling_sum", "rolling_mean", "days"), row)) for row in rows]
+
+# Queries served at /<name>: the function and the type of each query string parameter, required ones first
+# Every function takes (connection, **parameters) and returns JSON-serialisable results
+QUERIES = {
+    "countries": (Analytics.countries, {"after": int, "limit": int}),
+    "cities": (Analytics.cities, {"after": int, "limit": int}),
+    "average_annual_temperature": (Analytics.average_annual_temperature, {"city_id": int, "year": int}),
+    "average_seven_day_precipitation": (Analytics.average_seven_day_precipitation, {"city_id": int, "start_date": str}),
+    "average_mean_temp_by_city": (Analytics.average_mean_temp_by_city,
+                                  {"date_from": str, "date_to": str, "after": str, "limit": int}),
+    "average_annual_precipitation_by_country": (Analytics.average_annual_precipitation_by_country,
+                                                {"year": int, "after": str, "limit": int}),
+    "cities_over_threshold": (lambda connection, threshold, metric="precipitation", window=7:
+                              _rolling_rows(Rolling.cities_over_threshold(connection, threshold, metric, window)),
+                              {"threshold": float, "metric": str, "window": int}),
+}
+
+# Read-only connection held by each worker process for its whole life
+_connection = None
+
+# Function run once in each worker process to open its connection
+def _init_worker(db_path):
+    global _connection
+    _connection = connect_read_only(db_path)
+
+# Function run in a worker process to answer one query
+def _run_query(name, parameters):
+    return QUERIES[name][0](_connection, **parameters)
+
+# Function to convert query string values to the parameter types of a query, raising ValueError for bad input
+def parse_parameters(name, query_string):
+    if name not in QUERIES:
+        raise ValueError(f"Unknown query '{name}', expected one of {', '.join(QUERIES)}")
+    types = QUERIES[name][1]
+    values = {key: value[-1] for key, value in parse_qs(query_string).items()}
+    unknown = [key for key in values if key not in types]
+    if unknown:
+        raise ValueError(f"Unknown parameters for {name}: {', '.join(unknown)}")
+    parameters = {key: types[key](value) for key, value in values.items()}
+    try:
+        inspect.signature(QUERIES[name][0]).bind(None, **parameters)
+    except TypeError as ex:
+        raise ValueError(f"Bad parameters for {name}: {ex}")
+    return parameters
+
+# Class to handle one HTTP request: GET /<query>?<parameters> answers {"result": ...} or {"error": ...}
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        name = url.path.strip("/")
+        if not name:
+            self._send(200, {"queries": {query: list(types) for query, (_, types) in QUERIES.items()}})
+            return
+        try:
+            parameters = parse_parameters(name, url.query)
+        except ValueError as ex:
+            self._send(400, {"error": str(ex)})
+            return
+
+        try:
+            result = self.server.executor.submit(_run_query, name, parameters).result(timeout=QUERY_TIMEOUT)
+            self._send(200, {"result": result})
+        except TimeoutError:
+            self._send(504, {"error": f"Query {name} did not finish within {QUERY_TIMEOUT}s"})
+        except (sqlite3.Error, ValueError) as ex:
+            self._send(500, {"error": f"Error executing query: {ex}"})
+
+    def _send(self, status, body):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    # Keep the console quiet; errors are still reported to the client
+    def log_message(self, format, *args):
+        pass
+
+# Class serving the analytics queries over HTTP, with each request handled on its own thread
+# and the query itself run in a pool of worker processes that keep their read-only connections open
+class QueryServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, db_path=DATABASE_PATH, workers=None):
+        # Fail here rather than in every worker if the database cannot be opened
+        connect_read_only(db_path).close()
+        self.workers = workers or os.cpu_count()
+        # Workers are spawned rather than forked, since they start from the request handler threads
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_init_worker, initargs=(db_path,))
+        super().__init__((host, port), QueryRequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(cancel_futures=True)
+
+# Function for clients to run a query on a query server and return its result, raising RuntimeError for errors
+def query(name, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=QUERY_TIMEOUT, **parameters):
+    url = f"http://{host}:{port}/{name}"
+    if parameters:
+        url += f"?{urlencode(parameters)}"
+    try:
+        with urlopen(url, timeout=timeout) as response:
+            body = json.loads(response.read())
+    except OSError as ex:
+        body = json.loads(ex.read()) if hasattr(ex, "read") else {"error": str(ex)}
+    if "error" in body:
+        raise RuntimeError(body["error"])
+    return body["result"]
+
+# Run the query server from the command line: python QueryServer.py [--host HOST] [--port PORT] [--workers N] [--db PATH]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the analytics queries as JSON over local HTTP")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--db", default=DATABASE_PATH)
+    args = parser.parse_args()
+
+    try:
+        server = QueryServer(args.host, args.port, args.db, args.workers)
+    except sqlite3.Error as ex:
+        print(f"Error connecting to database: {ex}")
+    else:
+        print(f"Serving {len(QUERIES)} queries on http://{args.host}:{args.port}/ with {server.workers} workers")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,87 @@
+import queue
+import sqlite3
+import threading
+from Database import DATABASE_PATH, connect_read_only
+
+# Class to run GUI queries on background threads, each holding its own reusable read connection
+# Only the most recently submitted query counts: older queued queries are skipped, running ones are interrupted
+# and their results are dropped
+class QueryWorkerPool:
+    def __init__(self, db_path=DATABASE_PATH, workers=2):
+        self.db_path = db_path
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.latest_job = 0
+        self.running = {}
+        self.lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    # Queue query_func(connection, *args) and cancel any query submitted before it
+    def submit(self, query_func, *args):
+        with self.lock:
+            self.latest_job += 1
+            job_id = self.latest_job
+            for running_job, connection in self.running.values():
+                if running_job < job_id:
+                    # interrupt() is safe to call from another thread and aborts the running statement
+                    connection.interrupt()
+        self.jobs.put((job_id, query_func, args))
+        return job_id
+
+    def is_current(self, job_id):
+        with self.lock:
+            return job_id == self.latest_job
+
+    # Return the result of the current query if it has finished, without blocking; None otherwise
+    def poll(self):
+        while True:
+            try:
+                job_id, result, error = self.results.get_nowait()
+            except queue.Empty:
+                return None
+            if self.is_current(job_id):
+                return result, error
+
+    def _work(self):
+        connection = None
+        try:
+            connection = connect_read_only(self.db_path, check_same_thread=False)
+        except sqlite3.Error as ex:
+            connection = None
+            connection_error = ex
+
+        worker = threading.get_ident()
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            job_id, query_func, args = job
+            if not self.is_current(job_id):
+                continue
+            if connection is None:
+                self.results.put((job_id, None, connection_error))
+                continue
+
+            with self.lock:
+                self.running[worker] = (job_id, connection)
+            try:
+                self.results.put((job_id, query_func(connection, *args), None))
+            except Exception as ex:
+                self.results.put((job_id, None, ex))
+            finally:
+                with self.lock:
+                    del self.running[worker]
+
+        if connection is not None:
+            connection.close()
+
+    # Stop the worker threads once they finish their current query
+    def shutdown(self):
+        with self.lock:
+            self.latest_job += 1
+            for _, connection in self.running.values():
+                connection.interrupt()
+        for _ in self.threads:
+            self.jobs.put(None)
@@ -0,0 +1,227 @@
+from Shards import use_shards
+
+# Function to count cities per country name from already loaded rows, in one pass over each list
+# Countries without cities count 0; cities whose country is unknown are ignored
+def count_cities_per_country(countries, cities):
+    names = {country['id']: country['name'] for country in countries}
+    city_count = {name: 0 for name in names.values()}
+    for city in cities:
+        name = names.get(city['country_id'])
+        if name is not None:
+            city_count[name] += 1
+    return city_count
+
+# Class to fetch the per-city aggregates used by the Phase 2 charts with one GROUP BY query each,
+# caching the results for the duration of a report run
+# On a sharded database (see Shards.py) every shard is attached, since most charts cover all stored days
+class ReportData:
+    def __init__(self, connection):
+        self.connection = connection
+        self.cache = {}
+        use_shards(connection)
+
+    # WHERE condition and parameters restricting daily rows to the cities of one country, or to every city
+    @staticmethod
+    def _country_filter(country_id):
+        if country_id is None:
+            return "1", []
+        return "city_id IN (SELECT id FROM cities WHERE country_id = ?)", [country_id]
+
+    def _cached(self, key, load):
+        if key not in self.cache:
+            self.cache[key] = load()
+        return self.cache[key]
+
+    # Forget cached results, e.g. before rendering the next report from the same connection
+    def clear(self):
+        self.cache.clear()
+
+    # Every country as a list of rows
+    def countries(self):
+        def load():
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT * FROM countries ORDER BY id")
+            countries = cursor.fetchall()
+            cursor.close()
+            return countries
+        return self._cached(("countries",), load)
+
+    # Every city, or only the cities of one country, as a list of rows
+    def cities(self, country_id=None):
+        def load():
+            cursor = self.connection.cursor()
+            if country_id is None:
+                cursor.execute("SELECT * FROM cities ORDER BY id")
+            else:
+                cursor.execute("SELECT * FROM cities WHERE country_id = ? ORDER BY id", (country_id,))
+            cities = cursor.fetchall()
+            cursor.close()
+            return cities
+        return self._cached(("cities", country_id), load)
+
+    # Average precipitation within a period over every city, or only the cities of one country
+    def average_precipitation(self, start_date, end_date, country_id=None):
+        def load():
+            query = "SELECT AVG(precipitation) FROM daily_weather_entries WHERE date BETWEEN ? AND ?"
+            params = [start_date, end_date]
+            if country_id is not None:
+                query += " AND city_id IN (SELECT id FROM cities WHERE country_id = ?)"
+                params.append(country_id)
+            cursor = self.connection.cursor()
+            cursor.execute(query, params)
+            average = cursor.fetchone()[0]
+            cursor.close()
+            return average
+        return self._cached(("average_precipitation", start_date, end_date, country_id), load)
+
+    # Number of cities per country name, in country id order, counted with a single GROUP BY join
+    def cities_per_country(self, country_id=None):
+        def load():
+            query = """
+            SELECT co.name, COUNT(ci.id)
+            FROM countries co
+            LEFT JOIN cities ci ON ci.country_id = co.id
+            WHERE ? IS NULL OR co.id = ?
+            GROUP BY co.id
+            ORDER BY co.id
+            """
+            cursor = self.connection.cursor()
+            cursor.execute(query, (country_id, country_id))
+            city_count = {row[0]: row[1] for row in cursor.fetchall()}
+            cursor.close()
+            return city_count
+        return self._cached(("cities_per_country", country_id), load)
+
+    # Per-country statistics keyed by country id: name, cities, cities_with_data, days,
+    # avg_temp and avg_precip over all stored days; daily rows are aggregated per city first
+    def country_statistics(self):
+        def load():
+            query = """
+            SELECT co.id, co.name,
+                   COUNT(ci.id) AS cities,
+                   COUNT(w.city_id) AS cities_with_data,
+                   COALESCE(SUM(w.days), 0) AS days,
+                   SUM(w.temp_sum) / SUM(w.temp_count) AS avg_temp,
+                   SUM(w.precip_sum) / SUM(w.precip_count) AS avg_precip
+            FROM countries co
+            LEFT JOIN cities ci ON ci.country_id = co.id
+            LEFT JOIN (
+                SELECT city_id, COUNT(*) AS days,
+                       SUM(mean_temp) AS temp_sum, COUNT(mean_temp) AS temp_count,
+                       SUM(precipitation) AS precip_sum, COUNT(precipitation) AS precip_count
+                FROM daily_weather_entries
+                GROUP BY city_id
+            ) w ON w.city_id = ci.id
+            GROUP BY co.id
+            ORDER BY co.id
+            """
+            cursor = self.connection.cursor()
+            cursor.execute(query)
+            columns = [column[0] for column in cursor.description]
+            statistics = {row[0]: dict(zip(columns[1:], row[1:])) for row in cursor.fetchall()}
+            cursor.close()
+            return statistics
+        return self._cached(("country_statistics",), load)
+
+    # Resolve a city id or name to its id, or None if there is no such city; names are looked up in the cached city list
+    def city_id(self, city):
+        if isinstance(city, int):
+            return city
+        ids = self._cached(("city_ids",), lambda: {row['name']: row['id'] for row in self.cities()})
+        return ids.get(city)
+
+    # Statistics of a city (id or name) for each of the given (start, end) periods, both ends inclusive,
+    # computed with a single query; returns one dict per period, in order, with min_temp and max_temp
+    # (of the daily mean temperature), avg_temp, avg_precip and days
+    def period_statistics(self, city, periods):
+        periods = [tuple(period) for period in periods]
+        def load():
+            empty = {"min_temp": None, "max_temp": None, "avg_temp": None, "avg_precip": None, "days": 0}
+            city_id = self.city_id(city)
+            if city_id is None or not periods:
+                return [dict(empty) for _ in periods]
+            # Joining a VALUES list of periods lets each period use the (city_id, date) index and allows overlapping periods
+            values = ", ".join("(?, ?, ?)" for _ in periods)
+            query = f"""
+            WITH periods(period, start_date, end_date) AS (VALUES {values})
+            SELECT p.period, MIN(d.mean_temp), MAX(d.mean_temp), AVG(d.mean_temp), AVG(d.precipitation), COUNT(d.date)
+            FROM periods p
+            JOIN daily_weather_entries d ON d.city_id = ? AND d.date BETWEEN p.start_date AND p.end_date
+            GROUP BY p.period
+            """
+            params = [value for i, (start, end) in enumerate(periods) for value in (i, start, end)]
+            cursor = self.connection.cursor()
+            cursor.execute(query, params + [city_id])
+            statistics = [dict(empty) for _ in periods]
+            for period, min_temp, max_temp, avg_temp, avg_precip, days in cursor.fetchall():
+                statistics[period] = {"min_temp": min_temp, "max_temp": max_temp, "avg_temp": avg_temp,
+                                      "avg_precip": avg_precip, "days": days}
+            cursor.close()
+            return statistics
+        return self._cached(("period_statistics", city, tuple(periods)), load)
+
+    # Average, minimum and maximum mean temperature for every city, or the cities of one country, over all stored days,
+    # keyed by city id
+    def city_temperature_stats(self, country_id=None):
+        def load():
+            where, params = self._country_filter(country_id)
+            query = f"""
+            SELECT city_id, AVG(mean_temp) AS avg_temp, MIN(mean_temp) AS min_temp, MAX(mean_temp) AS max_temp
+            FROM daily_weather_entries
+            WHERE {where}
+            GROUP BY city_id
+            """
+            cursor = self.connection.cursor()
+            cursor.execute(query, params)
+            stats = {row[0]: (row[1], row[2], row[3]) for row in cursor.fetchall()}
+            cursor.close()
+            return stats
+        return self._cached(("city_temperature_stats", country_id), load)
+
+    # Average mean temperature per city, in the order of the given cities, with 0 for cities without data
+    # Pass the cities' country_id to only aggregate that country's rows
+    def average_temperatures(self, cities, country_id=None):
+        stats = self.city_temperature_stats(country_id)
+        averages = []
+        for city in cities:
+            avg_temp = stats.get(city['id'], (None, None, None))[0]
+            averages.append(avg_temp if avg_temp is not None else 0)
+        return averages
+
+    # Minimum and maximum mean temperature per city within a period, for every city or the cities of one country,
+    # keyed by city id
+    def min_max_by_city(self, start_date, end_date, country_id=None):
+        def load():
+            where, params = self._country_filter(country_id)
+            query = f"""
+            SELECT city_id, MIN(mean_temp) AS min_temp, MAX(mean_temp) AS max_temp
+            FROM daily_weather_entries
+            WHERE date BETWEEN ? AND ? AND {where}
+            GROUP BY city_id
+            """
+            cursor = self.connection.cursor()
+            cursor.execute(query, [start_date, end_date, *params])
+            min_max = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+            cursor.close()
+            return min_max
+        return self._cached(("min_max_by_city", start_date, end_date, country_id), load)
+
+    # Every non-null mean temperature per city, for every city or the cities of one country, keyed by city id,
+    # fetched with a single query
+    def temperatures_by_city(self, country_id=None):
+        def load():
+            where, params = self._country_filter(country_id)
+            query = f"""
+            SELECT city_id, mean_temp FROM daily_weather_entries
+            WHERE mean_temp IS NOT NULL AND {where}
+            ORDER BY city_id
+            """
+            cursor = self.connection.cursor()
+            cursor.execute(query, params)
+            temperatures = {}
+            for city_id, mean_temp in cursor:
+                temperatures.setdefault(city_id, []).append(mean_temp)
+            cursor.close()
+            return temperatures
+        return self._cached(("temperatures_by_city", country_id), load)
+
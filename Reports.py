@@ -0,0 +1,228 @@
+import argparse
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from matplotlib.figure import Figure
+from Database import DATABASE_PATH
+from ReportData import ReportData
+
+# Periods compared by the period charts when none are given
+DEFAULT_PERIODS = [("2020-01-01", "2020-06-30"), ("2020-07-01", "2020-12-31")]
+
+# City used by the single-city charts when none is given
+DEFAULT_CITY = "Middlesbrough"
+
+# File formats a report can be rendered to
+REPORT_FORMATS = ("png", "svg")
+
+# Function to label a (start, end) period
+def period_label(period):
+    return f"{period[0]} to {period[1]}"
+
+# Function to turn a city or country name into a safe file name part
+def file_slug(name):
+    return re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_").lower()
+
+# The draw_* functions draw one chart onto a matplotlib Axes, so they work both on pyplot figures
+# for interactive use and on standalone Figure objects for headless rendering
+
+def draw_avg_precipitation(ax, periods, values):
+    ax.bar([period_label(period) for period in periods], values, color=['blue', 'green'])
+    ax.set_xlabel('Period')
+    ax.set_ylabel('Average Precipitation (mm)')
+    ax.set_title(f'Average Precipitation for {len(periods)} Periods')
+
+def draw_min_max_temp(ax, city_name, min_max):
+    ax.bar(city_name, [min_max[0]], width=0.4, label='Min Temp (°C)', color='blue', align='center')
+    ax.bar(city_name, [min_max[1]], width=0.4, label='Max Temp (°C)', color='red', align='edge')
+    ax.set_xlabel('City')
+    ax.set_ylabel('Temperature (°C)')
+    ax.set_title(f'Min and Max Temperatures for {city_name}')
+    ax.legend()
+
+def draw_cities_per_country(ax, city_count):
+    ax.bar(list(city_count.keys()), list(city_count.values()), color='orange')
+    ax.set_xlabel('Country')
+    ax.set_ylabel('Number of Cities')
+    ax.set_title('Number of Cities in Each Country')
+
+def draw_temp_variations(ax, city_names, min_temps, max_temps):
+    ax.plot(city_names, min_temps, label='Min Temp (°C)', marker='o', color='blue')
+    ax.plot(city_names, max_temps, label='Max Temp (°C)', marker='x', color='red')
+    ax.set_xlabel('City')
+    ax.set_ylabel('Temperature (°C)')
+    ax.set_title('Temperature Variations for All Cities')
+    ax.legend()
+
+def draw_avg_temp(ax, city_names, avg_temps):
+    ax.bar(city_names, avg_temps, color='purple')
+    ax.set_xlabel('City')
+    ax.set_ylabel('Average Temperature (°C)')
+    ax.set_title('Average Temperature for All Cities')
+
+def draw_temp_variation_for_periods(ax, city_name, periods, min_max_per_period):
+    labels = [f"{city_name} - {period_label(period)}" for period in periods]
+    x = range(len(labels))
+    ax.barh(x, [min_max[0] for min_max in min_max_per_period], height=0.4, label='Min Temp (°C)', color='blue', align='center')
+    ax.barh(x, [min_max[1] for min_max in min_max_per_period], height=0.4, label='Max Temp (°C)', color='red', align='edge')
+    ax.set_yticks(x, labels, fontsize=8)
+    ax.set_xlabel('Temperature (°C)')
+    ax.set_ylabel('Period')
+    ax.set_title(f'Temperature Variation for {city_name}')
+    ax.legend()
+
+def draw_box_plot(ax, city_names, temperature_data):
+    ax.boxplot(temperature_data, tick_labels=city_names)
+    ax.set_xlabel('City')
+    ax.set_ylabel('Temperature (°C)')
+    ax.set_title('Temperature Distribution for Each City')
+
+def draw_pie_chart(ax, city_names, avg_temps):
+    ax.pie(avg_temps, labels=city_names, autopct='%1.1f%%', startangle=90)
+    ax.set_title('Distribution of Average Temperatures Across Cities')
+    ax.axis('equal')
+
+# The load_* functions fetch the arguments of the matching draw_* function from ReportData
+# options holds the report parameters: periods, city_name and country_id
+# Country reports pass country_id down, so each worker only aggregates that country's rows
+
+# Function to fetch a city's statistics for each period with one query, raising ValueError for unknown cities
+def city_period_statistics(report_data, city_name, periods):
+    if report_data.city_id(city_name) is None:
+        raise ValueError(f"Unknown city '{city_name}'")
+    return report_data.period_statistics(city_name, periods)
+
+def load_avg_precipitation(report_data, options):
+    periods = options["periods"]
+    return periods, [report_data.average_precipitation(start, end, options.get("country_id")) for start, end in periods]
+
+def load_min_max_temp(report_data, options):
+    statistics = city_period_statistics(report_data, options["city_name"], options["periods"][:1])[0]
+    return options["city_name"], (statistics["min_temp"], statistics["max_temp"])
+
+def load_cities_per_country(report_data, options):
+    return (report_data.cities_per_country(options.get("country_id")),)
+
+def load_temp_variations(report_data, options):
+    cities = report_data.cities(options.get("country_id"))
+    min_max = report_data.min_max_by_city(*options["periods"][0], options.get("country_id"))
+    return ([city['name'] for city in cities],
+            [min_max.get(city['id'], (None, None))[0] for city in cities],
+            [min_max.get(city['id'], (None, None))[1] for city in cities])
+
+def load_avg_temp(report_data, options):
+    cities = report_data.cities(options.get("country_id"))
+    return [city['name'] for city in cities], report_data.average_temperatures(cities, options.get("country_id"))
+
+def load_temp_variation_for_periods(report_data, options):
+    periods = options["periods"]
+    statistics = city_period_statistics(report_data, options["city_name"], periods)
+    return options["city_name"], periods, [(period["min_temp"], period["max_temp"]) for period in statistics]
+
+def load_box_plot(report_data, options):
+    cities = report_data.cities(options.get("country_id"))
+    temperatures = report_data.temperatures_by_city(options.get("country_id"))
+    return [city['name'] for city in cities], [temperatures.get(city['id'], []) for city in cities]
+
+# Chart name -> (loader, drawer, figure size, whether the chart is about a single city)
+CHARTS = {
+    "avg_precipitation": (load_avg_precipitation, draw_avg_precipitation, (8, 6), False),
+    "min_max_temp": (load_min_max_temp, draw_min_max_temp, (6, 6), True),
+    "cities_per_country": (load_cities_per_country, draw_cities_per_country, (10, 6), False),
+    "temp_variations": (load_temp_variations, draw_temp_variations, (12, 6), False),
+    "avg_temp": (load_avg_temp, draw_avg_temp, (12, 6), False),
+    "temp_variation_for_periods": (load_temp_variation_for_periods, draw_temp_variation_for_periods, (10, 6), True),
+    "box_plot": (load_box_plot, draw_box_plot, (12, 6), False),
+    "pie_chart": (load_avg_temp, draw_pie_chart, (8, 8), False),
+}
+
+# Function to render one chart to a file; runs in a worker process with its own read-only connection
+# Uses a standalone Figure (Agg canvas) rather than pyplot, so no display or global figure state is needed
+def render_chart(chart, output_path, options, db_path=DATABASE_PATH):
+    load, draw, figsize, _ = CHARTS[chart]
+    with sqlite3.connect(f"file:{db_path}?mode=ro", uri=True) as connection:
+        connection.row_factory = sqlite3.Row
+        args = load(ReportData(connection), options)
+    fig = Figure(figsize=figsize)
+    draw(fig.add_subplot(), *args)
+    fig.tight_layout()
+    fig.savefig(output_path)
+    return output_path
+
+# Function to list the (chart, output_path, options) jobs for one report written to output_dir
+# City charts are drawn for city_name when it is in the report's cities, or for every city of the country
+# when a country report has no city
+def report_jobs(output_dir, charts, file_format, options, report_data):
+    jobs = []
+    for chart in charts:
+        if not CHARTS[chart][3]:
+            jobs.append((chart, os.path.join(output_dir, f"{chart}.{file_format}"), options))
+        elif options.get("city_name") is not None:
+            cities = report_data.cities(options.get("country_id"))
+            if any(city['name'] == options["city_name"] for city in cities):
+                jobs.append((chart, os.path.join(output_dir, f"{chart}.{file_format}"), options))
+            elif options.get("country_id") is None:
+                print(f"Skipping {chart}: unknown city '{options['city_name']}'")
+        else:
+            for city in report_data.cities(options.get("country_id")):
+                city_options = dict(options, city_name=city['name'])
+                jobs.append((chart, os.path.join(output_dir, f"{chart}_{file_slug(city['name'])}.{file_format}"), city_options))
+    return jobs
+
+# Function to render reports in a process pool and return the paths of the files written
+# With per_country, one report directory is written per country, using only that country's cities
+def render_reports(output_dir, charts=None, file_format="png", city_name=None, periods=None, per_country=False,
+                   db_path=DATABASE_PATH, max_workers=None):
+    charts = list(charts or CHARTS)
+    unknown = [chart for chart in charts if chart not in CHARTS]
+    if unknown:
+        raise ValueError(f"Unknown charts: {', '.join(unknown)}")
+    if file_format not in REPORT_FORMATS:
+        raise ValueError(f"Unknown report format '{file_format}', expected one of {', '.join(REPORT_FORMATS)}")
+    options = {"periods": [tuple(period) for period in (periods or DEFAULT_PERIODS)], "city_name": city_name, "country_id": None}
+
+    jobs = []
+    try:
+        with sqlite3.connect(f"file:{db_path}?mode=ro", uri=True) as connection:
+            connection.row_factory = sqlite3.Row
+            report_data = ReportData(connection)
+            if per_country:
+                for country in report_data.countries():
+                    country_dir = os.path.join(output_dir, file_slug(country['name']))
+                    os.makedirs(country_dir, exist_ok=True)
+                    jobs.extend(report_jobs(country_dir, charts, file_format, dict(options, country_id=country['id']), report_data))
+            else:
+                os.makedirs(output_dir, exist_ok=True)
+                jobs.extend(report_jobs(output_dir, charts, file_format, dict(options, city_name=city_name or DEFAULT_CITY), report_data))
+    except sqlite3.Error as ex:
+        print(f"Error connecting to database: {ex}")
+        return []
+
+    written = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(render_chart, chart, output_path, chart_options, db_path): output_path
+                   for chart, output_path, chart_options in jobs}
+        for future in as_completed(futures):
+            try:
+                written.append(future.result())
+            except (sqlite3.Error, ValueError) as ex:
+                print(f"Error rendering {futures[future]}: {ex}")
+    return sorted(written)
+
+# Render reports from the command line, e.g. for the nightly per-country run:
+# python Reports.py reports --per-country --format svg
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the Phase 2 charts to image files without a display")
+    parser.add_argument("output_dir")
+    parser.add_argument("--format", choices=REPORT_FORMATS, default="png")
+    parser.add_argument("--city", help=f"city for the single-city charts (default: {DEFAULT_CITY}, or every city in per-country reports)")
+    parser.add_argument("--period", nargs=2, action="append", metavar=("START", "END"), help="period to compare, may be repeated")
+    parser.add_argument("--chart", action="append", choices=list(CHARTS), help="chart to render, may be repeated (default: all)")
+    parser.add_argument("--per-country", action="store_true", help="write one report per country")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--db", default=DATABASE_PATH)
+    args = parser.parse_args()
+
+    paths = render_reports(args.output_dir, args.chart, args.format, args.city, args.period, args.per_country, args.db, args.workers)
+    print(f"Rendered {len(paths)} charts to {args.output_dir}")
@@ -0,0 +1,91 @@
+import sqlite3
+from datetime import date, timedelta
+from Shards import use_shards
+
+# Metrics that can be rolled; checked before being placed into SQL
+ROLLING_METRICS = {"min_temp", "max_temp", "mean_temp", "precipitation"}
+
+# Function to validate the metric and window size before they are placed into SQL
+def _check_window(metric, window):
+    if metric not in ROLLING_METRICS:
+        raise ValueError(f"Unknown metric '{metric}', expected one of {', '.join(sorted(ROLLING_METRICS))}")
+    if int(window) < 1:
+        raise ValueError("The rolling window must be at least one day")
+
+# Function to build the window query computing an N-day rolling sum and mean of a metric
+# The window is defined on julianday(date) so missing days shorten the window instead of stretching it,
+# and rows from the N-1 days before date_from are read so the first windows are complete
+def _rolling_query(metric, window, city_id, date_from, date_to):
+    _check_window(metric, window)
+
+    conditions = []
+    params = []
+    if city_id is not None:
+        conditions.append("city_id = ?")
+        params.append(city_id)
+    if date_from is not None:
+        conditions.append("date >= date(?, ?)")
+        params.extend([date_from, f"-{int(window) - 1} day"])
+    if date_to is not None:
+        conditions.append("date <= ?")
+        params.append(date_to)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    query = f"""
+    SELECT city_id, date, rolling_sum, rolling_mean, days FROM (
+        SELECT city_id, date,
+               SUM({metric}) OVER rolling_window AS rolling_sum,
+               AVG({metric}) OVER rolling_window AS rolling_mean,
+               COUNT({metric}) OVER rolling_window AS days
+        FROM daily_weather_entries
+        {where}
+        WINDOW rolling_window AS (PARTITION BY city_id ORDER BY julianday(date) RANGE BETWEEN {int(window) - 1} PRECEDING AND CURRENT ROW)
+    )
+    {"WHERE date >= ?" if date_from is not None else ""}
+    ORDER BY city_id, date
+    """
+    if date_from is not None:
+        params.append(date_from)
+    return query, params
+
+# Function to compute the N-day rolling sum and mean of a metric for one city (or every city) in a single pass
+# Returns (city_id, date, rolling_sum, rolling_mean, days) rows, where days is how many values were in the window
+def rolling_series(connection, metric="precipitation", window=7, city_id=None, date_from=None, date_to=None):
+    query, params = _rolling_query(metric, window, city_id, date_from, date_to)
+    # The first windows also read the N-1 days before date_from
+    first_day = (date.fromisoformat(date_from) - timedelta(days=int(window) - 1)).isoformat() if date_from is not None else None
+    use_shards(connection, first_day, date_to)
+    cursor = connection.cursor()
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+# Function to return the latest N-day rolling values for every city in one query, as used for flood alerting
+# Returns {city_id: (city_id, latest_date, rolling_sum, rolling_mean, days)}
+def latest_rolling(connection, metric="precipitation", window=7):
+    _check_window(metric, window)
+    query = f"""
+    WITH latest AS (
+        SELECT city_id, MAX(date) AS latest_date FROM daily_weather_entries GROUP BY city_id
+    )
+    SELECT d.city_id, l.latest_date, SUM(d.{metric}), AVG(d.{metric}), COUNT(d.{metric})
+    FROM daily_weather_entries d
+    JOIN latest l ON d.city_id = l.city_id
+    WHERE d.date >= date(l.latest_date, ?)
+    GROUP BY d.city_id
+    """
+    use_shards(connection)
+    cursor = connection.cursor()
+    cursor.execute(query, (f"-{int(window) - 1} day",))
+    latest = {row[0]: tuple(row) for row in cursor.fetchall()}
+    cursor.close()
+    return latest
+
+# Function to list the cities whose latest N-day rolling sum of a metric is at or above a threshold
+def cities_over_threshold(connection, threshold, metric="precipitation", window=7):
+    try:
+        return [row for row in latest_rolling(connection, metric, window).values() if row[2] is not None and row[2] >= threshold]
+    except sqlite3.OperationalError as ex:
+        print(f"Error executing query: {ex}")
+        return []
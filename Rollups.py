@@ -0,0 +1,181 @@
+import calendar
+import sqlite3
+
+# Metrics summarised in the rollup tables; each gets a count, sum, min and max column
+ROLLUP_METRICS = ["min_temp", "max_temp", "mean_temp", "precipitation"]
+
+# Period column and period length (as characters of the ISO date) of each rollup table
+ROLLUP_TABLES = {
+    "monthly_weather_rollups": ("month", 7),
+    "annual_weather_rollups": ("year", 4),
+}
+
+_metric_columns = [f"{metric}_{stat}" for metric in ROLLUP_METRICS for stat in ("count", "sum", "min", "max")]
+
+# Function to build the SELECT list that aggregates raw daily rows into rollup columns
+def _aggregate_daily_columns():
+    return ", ".join(
+        f"COUNT({metric}), SUM({metric}), MIN({metric}), MAX({metric})" for metric in ROLLUP_METRICS
+    )
+
+# Function to build the SELECT list that combines monthly rollups into annual ones
+def _aggregate_monthly_columns():
+    return ", ".join(
+        f"SUM({metric}_count), SUM({metric}_sum), MIN({metric}_min), MAX({metric}_max)" for metric in ROLLUP_METRICS
+    )
+
+# Function to create the rollup tables, filling them from existing data the first time
+def ensure_rollup_tables(conn):
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'monthly_weather_rollups'"
+    ).fetchone()
+    if exists:
+        return
+
+    for table, (period, _) in ROLLUP_TABLES.items():
+        columns = ", ".join(f"{column} {'INTEGER' if column.endswith('_count') else 'REAL'}" for column in _metric_columns)
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                city_id INTEGER NOT NULL,
+                {period} TEXT NOT NULL,
+                days INTEGER NOT NULL,
+                {columns},
+                PRIMARY KEY (city_id, {period})
+            ) WITHOUT ROWID
+        ''')
+
+    print("Building monthly and annual rollups from existing weather data...")
+    rebuild_rollups(conn)
+    conn.commit()
+
+# Function to rebuild both rollup tables from scratch
+def rebuild_rollups(conn):
+    conn.execute("DELETE FROM monthly_weather_rollups")
+    conn.execute("DELETE FROM annual_weather_rollups")
+    conn.execute(f'''
+        INSERT INTO monthly_weather_rollups (city_id, month, days, {", ".join(_metric_columns)})
+        SELECT city_id, substr(date, 1, 7), COUNT(*), {_aggregate_daily_columns()}
+        FROM daily_weather_entries
+        GROUP BY city_id, substr(date, 1, 7)
+    ''')
+    conn.execute(f'''
+        INSERT INTO annual_weather_rollups (city_id, year, days, {", ".join(_metric_columns)})
+        SELECT city_id, substr(month, 1, 4), SUM(days), {_aggregate_monthly_columns()}
+        FROM monthly_weather_rollups
+        GROUP BY city_id, substr(month, 1, 4)
+    ''')
+
+# Function to return the first day of the month after the given 'YYYY-MM' month
+def _next_month_start(month):
+    year, month_number = int(month[:4]), int(month[5:7])
+    if month_number == 12:
+        return f"{year + 1:04d}-01-01"
+    return f"{year:04d}-{month_number + 1:02d}-01"
+
+# Function to list the statements that refresh the rollups touched by new rows for a city
+# Statements use named parameters so they run on both sqlite3 connections and SQLAlchemy sessions
+def rollup_refresh_statements(city_id, dates):
+    statements = []
+    months = sorted({date[:7] for date in dates})
+    years = sorted({month[:4] for month in months})
+
+    for month in months:
+        params = {"city_id": city_id, "month": month, "month_start": f"{month}-01", "month_end": _next_month_start(month)}
+        statements.append(("DELETE FROM monthly_weather_rollups WHERE city_id = :city_id AND month = :month", params))
+        statements.append((f'''
+            INSERT INTO monthly_weather_rollups (city_id, month, days, {", ".join(_metric_columns)})
+            SELECT city_id, :month, COUNT(*), {_aggregate_daily_columns()}
+            FROM daily_weather_entries
+            WHERE city_id = :city_id AND date >= :month_start AND date < :month_end
+            GROUP BY city_id
+        ''', params))
+
+    for year in years:
+        params = {"city_id": city_id, "year": year, "next_year": f"{int(year) + 1:04d}"}
+        statements.append(("DELETE FROM annual_weather_rollups WHERE city_id = :city_id AND year = :year", params))
+        statements.append((f'''
+            INSERT INTO annual_weather_rollups (city_id, year, days, {", ".join(_metric_columns)})
+            SELECT city_id, :year, SUM(days), {_aggregate_monthly_columns()}
+            FROM monthly_weather_rollups
+            WHERE city_id = :city_id AND month >= :year AND month < :next_year
+            GROUP BY city_id
+        ''', params))
+    return statements
+
+# Function to refresh the rollups for the months and years covered by the given dates, inside the caller's transaction
+def refresh_rollups(conn, city_id, dates):
+    for sql, params in rollup_refresh_statements(city_id, dates):
+        conn.execute(sql, params)
+
+# Function to check whether an inclusive date range starts and ends on month boundaries
+def is_month_aligned(date_from, date_to):
+    try:
+        year, month, day = (int(part) for part in date_to.split("-"))
+        last_day = calendar.monthrange(year, month)[1]
+        return date_from.endswith("-01") and day == last_day
+    except ValueError:
+        return False
+
+# Function to answer average_annual_temperature from the annual rollups; returns None if they are unavailable
+def average_annual_temperature(connection, city_id, year):
+    try:
+        cursor = connection.cursor()
+        cursor.execute('''
+            SELECT c.name AS city_name, r.mean_temp_sum / r.mean_temp_count AS avg_temp
+            FROM annual_weather_rollups r
+            JOIN cities c ON r.city_id = c.id
+            WHERE r.city_id = ? AND r.year = ? AND r.mean_temp_count > 0
+        ''', (city_id, f"{int(year):04d}"))
+        result = cursor.fetchone()
+        cursor.close()
+        return result
+    except sqlite3.OperationalError:
+        return None
+
+# Function to build the keyset paging clauses used by the GUI's paged result tables
+# Rows are ordered by name_column and start after the name `after`; a limit of -1 means no limit in SQLite
+def page_clauses(name_column, after=None, limit=None):
+    where = f" AND {name_column} > ?" if after is not None else ""
+    where_params = (after,) if after is not None else ()
+    return where, where_params, f" ORDER BY {name_column} LIMIT ?", (limit if limit is not None else -1,)
+
+# Function to answer average_mean_temp_by_city from the monthly rollups; returns None if the range is not month aligned
+def average_mean_temp_by_city(connection, date_from, date_to, after=None, limit=None):
+    if not is_month_aligned(date_from, date_to):
+        return None
+    where, where_params, order, order_params = page_clauses("c.name", after, limit)
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f'''
+            SELECT c.name AS city_name, SUM(r.mean_temp_sum) / SUM(r.mean_temp_count) AS avg_temp
+            FROM monthly_weather_rollups r
+            JOIN cities c ON r.city_id = c.id
+            WHERE r.month >= ? AND r.month <= ?{where}
+            GROUP BY c.name
+            HAVING SUM(r.mean_temp_count) > 0{order}
+        ''', (date_from[:7], date_to[:7], *where_params, *order_params))
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+    except sqlite3.OperationalError:
+        return None
+
+# Function to answer average_annual_precipitation_by_country from the annual rollups; returns None if they are unavailable
+def average_annual_precipitation_by_country(connection, year, after=None, limit=None):
+    where, where_params, order, order_params = page_clauses("co.name", after, limit)
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f'''
+            SELECT co.name AS country_name, SUM(r.precipitation_sum) / SUM(r.precipitation_count) AS avg_precip
+            FROM annual_weather_rollups r
+            JOIN cities ci ON r.city_id = ci.id
+            JOIN countries co ON ci.country_id = co.id
+            WHERE r.year = ?{where}
+            GROUP BY co.name
+            HAVING SUM(r.precipitation_count) > 0{order}
+        ''', (f"{int(year):04d}", *where_params, *order_params))
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+    except sqlite3.OperationalError:
+        return None
@@ -1,8 +1,15 @@
-import requests
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey
-from sqlalchemy.orm import sessionmaker, relationship
-from sqlalchemy.ext.declarative import declarative_base
+import Network
+from Ingestion import run_pipeline
+from OpenMeteo import ARCHIVE_API_URL, build_archive_url, decode_json, fetch_weather_data_batch_raw
+from Database import DATABASE_PATH, ensure_schema
+from QueryCache import generation_bump_statements
+from Rollups import rollup_refresh_statements
+from Shards import ShardRouter
+from WeatherSchema import DAILY_COLUMNS, daily_row_mappings, hourly_rows, hourly_upsert_sql
+from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, Index, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import declarative_base, sessionmaker, relationship
 
 # Creating the Base class for SQLAlchemy models
 Base = declarative_base()
@@ -31,24 +38,48 @@ class DailyWeatherEntry(Base):
     max_temp = Column(Float)
     mean_temp = Column(Float)
     precipitation = Column(Float)
+    # Keep in step with WeatherSchema.DAILY_COLUMNS
+    apparent_max_temp = Column(Float)
 
     # Relationship to City
     city = relationship("City", back_populates="weather_entries")
 
+    # One row per city per day, so re-ingesting a day updates it instead of duplicating it
+    __table_args__ = (Index('idx_daily_weather_city_date', 'city_id', 'date', unique=True),)
+
 
 # SQLAlchemy engine and session
-DATABASE_URL = 'sqlite:///CIS4044-N-SDI-OPENMETEO-PARTIAL.db'
-engine = create_engine(DATABASE_URL, echo=True)
+DATABASE_URL = f'sqlite:///{DATABASE_PATH}'
+# Statement logging is off by default; set SQL_ECHO = True to debug queries
+SQL_ECHO = False
+engine = create_engine(DATABASE_URL, echo=SQL_ECHO)
 Session = sessionmaker(bind=engine)
 session = Session()
 
+# Number of rows sent to the database in each executemany call
+BATCH_SIZE = 5000
+
+# Make sure existing databases have the unique (city_id, date) index the bulk upsert relies on
+raw_connection = engine.raw_connection()
+try:
+    ensure_schema(raw_connection.driver_connection)
+    database_is_sharded = ShardRouter.for_connection(raw_connection.driver_connection) is not None
+finally:
+    raw_connection.close()
+
+# Function to refuse sharded databases (see Shards.py): this script only reads and writes the main daily table,
+# so its rollup refreshes would drop the days stored in the shards
+def ensure_unsharded():
+    if database_is_sharded:
+        raise ValueError(f"{DATABASE_PATH} is sharded; load it with Phase 3.py or Database.BulkLoader instead")
+
 # Function to fetch weather data from the Open-Meteo API
-def fetch_weather_data(city, lat, lon, start_date, end_date):
-    url = "https://archive-api.open-meteo.com/v1/archive?latitude=52.52&longitude=13.41&start_date=2024-12-20&end_date=2025-01-03&daily=temperature_2m_max,temperature_2m_min,temperature_2m_mean,apparent_temperature_max,precipitation_sum&timezone=GMT"
-    response = requests.get(url)
+def fetch_weather_data(city, lat, lon, start_date, end_date, api_url=ARCHIVE_API_URL):
+    url = build_archive_url(lat, lon, start_date, end_date, api_url=api_url)
+    response = Network.get(url)
     
     if response.status_code == 200:
-        data = response.json()
+        data = decode_json(response.content)
         return data["daily"]
     else:
         print(f"Error fetching data for {city}: {response.status_code}")
@@ -64,26 +95,75 @@ def get_or_insert_city(city_name, lat, lon, country_id):
         # City does not exist, so create a new one
         new_city = City(name=city_name, latitude=lat, longitude=lon, country_id=country_id)
         session.add(new_city)
-        session.commit()
+        # Flush to get the id; the city is committed together with its weather data
+        session.flush()
         return new_city.id
 
+# Function to turn an API daily payload into row mappings for the daily_weather_entries table
+def build_weather_rows(city_id, daily_data):
+    return daily_row_mappings(city_id, daily_data)
+
+# Function to write row mappings with Core executemany upserts, batch_size rows at a time
+def upsert_weather_rows(rows, batch_size=BATCH_SIZE):
+    stmt = sqlite_insert(DailyWeatherEntry.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["city_id", "date"],
+        set_={column: stmt.excluded[column] for column in DAILY_COLUMNS.values()},
+    )
+    for i in range(0, len(rows), batch_size):
+        session.execute(stmt, rows[i:i + batch_size])
+
+# Function to upsert the hourly data attached to a daily payload, if any
+def upsert_hourly_rows(city_id, daily_data, batch_size=BATCH_SIZE):
+    if not daily_data.get("hourly"):
+        return
+    rows = hourly_rows(city_id, daily_data["hourly"])
+    for i in range(0, len(rows), batch_size):
+        session.execute(text(hourly_upsert_sql()), rows[i:i + batch_size])
+
+# Function to refresh the monthly and annual rollups for the periods covered by the given dates
+# and bump their data generations so cached query results are invalidated
+def refresh_city_rollups(city_id, dates):
+    for sql, params in rollup_refresh_statements(city_id, dates) + generation_bump_statements(city_id, dates):
+        session.execute(text(sql), params)
+
 # Function to insert weather data into the database
-def insert_weather_data(city_name, daily_data, lat, lon, country_id):
-    # Get or insert the city and retrieve the city_id
-    city_id = get_or_insert_city(city_name, lat, lon, country_id)
-
-    for i in range(len(daily_data["time"])):
-        new_weather_entry = DailyWeatherEntry(
-            city_id=city_id,
-            date=daily_data["time"][i],
-            min_temp=daily_data["temperature_2m_min"][i],
-            max_temp=daily_data["temperature_2m_max"][i],
-            mean_temp=daily_data["temperature_2m_mean"][i],
-            precipitation=daily_data["precipitation_sum"][i]
-        )
-        session.add(new_weather_entry)
-
-    session.commit()
+# On error the transaction is rolled back, so a half-written city is never committed with a later one
+def insert_weather_data(city_name, daily_data, lat, lon, country_id, batch_size=BATCH_SIZE):
+    ensure_unsharded()
+    try:
+        # Get or insert the city and retrieve the city_id
+        city_id = get_or_insert_city(city_name, lat, lon, country_id)
+
+        upsert_weather_rows(build_weather_rows(city_id, daily_data), batch_size)
+        upsert_hourly_rows(city_id, daily_data, batch_size)
+        refresh_city_rollups(city_id, daily_data["time"])
+        session.commit()
+    except:
+        session.rollback()
+        raise
+
+# Function to insert weather data for many cities in one transaction
+# city_data is a list of (city_name, daily_data, lat, lon, country_id) tuples
+# A failed batch is rolled back as a whole and the error raised, so the pipeline counts it as failed
+def bulk_insert_weather_data(city_data, batch_size=BATCH_SIZE):
+    ensure_unsharded()
+    try:
+        rows = []
+        dates_by_city = {}
+        for city_name, daily_data, lat, lon, country_id in city_data:
+            city_id = get_or_insert_city(city_name, lat, lon, country_id)
+            rows.extend(build_weather_rows(city_id, daily_data))
+            upsert_hourly_rows(city_id, daily_data, batch_size)
+            dates_by_city.setdefault(city_id, set()).update(daily_data["time"])
+
+        upsert_weather_rows(rows, batch_size)
+        for city_id, dates in dates_by_city.items():
+            refresh_city_rollups(city_id, dates)
+        session.commit()
+    except:
+        session.rollback()
+        raise
 
 # List of cities to fetch weather data for, including their latitude and longitude
 cities = [
@@ -94,19 +174,17 @@ cities = [
 start_date = "2024-11-26"
 end_date = "2024-12-10"
 
-# Fetch and insert weather data for each city
-for city in cities:
-    print(f"Fetching data for {city['city']}...")
-    daily_data = fetch_weather_data(city["city"], city["lat"], city["lon"], start_date, end_date)
-    
-    if daily_data:
-        print(f"Inserting data for {city['city']}...")
-        insert_weather_data(city["city"], daily_data, city["lat"], city["lon"], city["country_id"])
-        print(f"Data for {city['city']} inserted successfully!")
+# Fetch weather data for all cities concurrently, several cities per request, decode it on a parser thread,
+# and write it through a single writer that commits many cities per transaction
+run_pipeline(cities, fetch_weather_data_batch_raw, bulk_insert_weather_data, start_date, end_date, fetch_workers=8, requests_per_second=5)
 
 # Function to print all weather data from the database
-def print_weather_data():
-    weather_entries = session.query(DailyWeatherEntry).all()
+def print_weather_data(chunk_size=BATCH_SIZE):
+    if database_is_sharded:
+        print(f"{DATABASE_PATH} is sharded; print its weather data with Phase 3.py instead")
+        return
+    # yield_per loads the entries chunk_size at a time instead of materialising them all
+    weather_entries = session.query(DailyWeatherEntry).yield_per(chunk_size)
     
     for entry in weather_entries:
         print(f"City ID: {entry.city_id}, Date: {entry.date}, Min Temp: {entry.min_temp}, Max Temp: {entry.max_temp}, Mean Temp: {entry.mean_temp}, Precipitation: {entry.precipitation}")
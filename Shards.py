@@ -0,0 +1,286 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+from QueryCache import bump_generations
+from Rollups import refresh_rollups
+from WeatherSchema import DAILY_COLUMNS, daily_upsert_sql
+
+# Directory holding the shard files, relative to the main database file
+SHARD_DIR = "weather_shards"
+
+# Number of years stored in each shard file; per-decade shards let every shard of the archive's history
+# (1940 onwards) be attached to one connection at once, within SQLite's default limit of 10 attached databases
+YEARS_PER_SHARD = 10
+
+# Columns of the shard tables and of the daily_weather_entries view over them
+SHARD_COLUMNS = ["city_id", "date", *DAILY_COLUMNS.values()]
+
+# Function to create the table in the main database recording every shard file; a database is sharded once it has rows
+def ensure_shard_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS weather_shards (
+            shard_year INTEGER PRIMARY KEY,
+            years INTEGER NOT NULL,
+            path TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+# Function to return {shard_year: (years, path)} for the shards of a database, empty if it is not sharded
+def registered_shards(conn):
+    try:
+        rows = conn.execute("SELECT shard_year, years, path FROM main.weather_shards ORDER BY shard_year").fetchall()
+    except sqlite3.OperationalError:
+        return {}
+    return {row[0]: (row[1], row[2]) for row in rows}
+
+# Function to return the directory of the connection's main database file, which shard paths are relative to
+def database_dir(conn):
+    for row in conn.execute("PRAGMA database_list"):
+        if row[1] == "main":
+            return os.path.dirname(row[2]) if row[2] else os.getcwd()
+    return os.getcwd()
+
+# Function to return how many databases can be attached to a connection
+def attach_limit(conn):
+    return conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+
+# Context manager letting a read-only (query_only) connection change its attachments and temporary views
+@contextmanager
+def schema_changes_allowed(conn):
+    query_only = conn.execute("PRAGMA query_only").fetchone()[0]
+    if query_only:
+        conn.execute("PRAGMA query_only = 0")
+    try:
+        yield
+    finally:
+        if query_only:
+            conn.execute("PRAGMA query_only = 1")
+
+# Class to store daily_weather_entries in per-decade (or per-year) SQLite files attached to a connection on demand
+# The main database keeps cities, countries, hourly data, the rollups and the weather_shards table listing the shards
+# Queries keep using daily_weather_entries: on a sharded database it is a temporary view over the main table
+# and the attached shards, so rollup refreshes and analytics read both; finished decades are never written again,
+# so their files stay unchanged between backups
+class ShardRouter:
+    def __init__(self, shard_dir=SHARD_DIR, years_per_shard=YEARS_PER_SHARD):
+        self.shard_dir = shard_dir
+        self.years_per_shard = years_per_shard
+
+    # Router for the shards recorded in a database, or None if the database is not sharded
+    @classmethod
+    def for_connection(cls, conn):
+        shards = registered_shards(conn)
+        if not shards:
+            return None
+        years, path = next(iter(shards.values()))
+        return cls(os.path.dirname(path), years)
+
+    # First year of the shard holding a date or year
+    def shard_year(self, date):
+        year = int(str(date)[:4])
+        return year - year % self.years_per_shard
+
+    # Path of a new shard file, relative to the main database file
+    def shard_path(self, shard_year):
+        return os.path.join(self.shard_dir, f"daily_{shard_year}.db")
+
+    def schema_name(self, shard_year):
+        return f"shard_{shard_year}"
+
+    # Shards that can hold rows in the inclusive date range (or every shard); every other shard is pruned
+    def shards_for_range(self, conn, date_from=None, date_to=None):
+        first = self.shard_year(date_from) if date_from is not None else None
+        last = self.shard_year(date_to) if date_to is not None else None
+        return [year for year in registered_shards(conn)
+                if (first is None or year >= first) and (last is None or year <= last)]
+
+    # Attach the given shards to the connection; with create set, missing shard files and tables are created
+    # ATTACH is not allowed inside a transaction, so this must run before the connection's next write
+    def attach(self, conn, shard_years, create=False):
+        attached = {row[1] for row in conn.execute("PRAGMA database_list")}
+        registered = registered_shards(conn)
+        base = database_dir(conn)
+        for shard_year in shard_years:
+            schema = self.schema_name(shard_year)
+            if schema in attached or (shard_year not in registered and not create):
+                continue
+            path = os.path.join(base, registered[shard_year][1] if shard_year in registered else self.shard_path(shard_year))
+            if create:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            conn.execute("ATTACH DATABASE ? AS " + schema, (path,))
+            if create:
+                conn.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {schema}.daily_weather_entries (
+                        city_id INTEGER NOT NULL,
+                        date TEXT NOT NULL,
+                        {', '.join(f"{column} REAL" for column in DAILY_COLUMNS.values())},
+                        PRIMARY KEY (city_id, date)
+                    ) WITHOUT ROWID
+                ''')
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_daily_weather_date ON daily_weather_entries (date)")
+
+    # Record newly created shards in the main database, inside the caller's transaction
+    def register(self, conn, shard_years):
+        conn.executemany("INSERT OR IGNORE INTO main.weather_shards (shard_year, years, path) VALUES (?, ?, ?)",
+                         [(year, self.years_per_shard, self.shard_path(year)) for year in shard_years])
+
+    # Drop the daily_weather_entries view and detach shards, except the given ones
+    def detach_all(self, conn, keep=()):
+        with schema_changes_allowed(conn):
+            conn.execute("DROP VIEW IF EXISTS temp.daily_weather_entries")
+            keep = {self.schema_name(year) for year in keep}
+            for row in conn.execute("PRAGMA database_list").fetchall():
+                if row[1].startswith("shard_") and row[1] not in keep:
+                    conn.execute(f"DETACH DATABASE {row[1]}")
+
+    # Make daily_weather_entries on this connection a view over the given shards (and the main table with include_main)
+    # Shards that are no longer needed are detached; nothing is done if the view already covers exactly these shards
+    def _set_view(self, conn, shard_years, include_main=True, create=False):
+        limit = attach_limit(conn)
+        if len(shard_years) > limit:
+            raise ValueError(f"The query spans {len(shard_years)} shards but only {limit} can be attached; "
+                             f"query a shorter date range or use more years per shard")
+        columns = ", ".join(SHARD_COLUMNS)
+        selects = [f"SELECT {columns} FROM main.daily_weather_entries"] if include_main else []
+        selects += [f"SELECT {columns} FROM {self.schema_name(year)}.daily_weather_entries" for year in shard_years]
+        body = " UNION ALL ".join(selects)
+        current = conn.execute("SELECT sql FROM temp.sqlite_master WHERE type = 'view' AND name = 'daily_weather_entries'").fetchone()
+        if current is not None and current[0].endswith(f" AS {body}"):
+            return
+        with schema_changes_allowed(conn):
+            self.detach_all(conn, keep=shard_years)
+            self.attach(conn, shard_years, create)
+            if selects:
+                conn.execute(f"CREATE TEMP VIEW daily_weather_entries AS {body}")
+
+    # Make daily_weather_entries cover the main table and the shards overlapping a date range (or every shard),
+    # raising ValueError if more shards are needed than can be attached
+    def use_range(self, conn, date_from=None, date_to=None):
+        shard_years = self.shards_for_range(conn, date_from, date_to)
+        self._set_view(conn, shard_years)
+        return shard_years
+
+    # Generator making daily_weather_entries cover each group of shards overlapping a date range in turn,
+    # so a query run once per group (and its results merged) sees every row exactly once for any number of shards
+    def shard_groups(self, conn, date_from=None, date_to=None):
+        shard_years = self.shards_for_range(conn, date_from, date_to)
+        group_size = attach_limit(conn)
+        for i in range(0, max(len(shard_years), 1), group_size):
+            group = shard_years[i:i + group_size]
+            # The main table only holds rows that were never migrated; it is read with the first group only
+            self._set_view(conn, group, include_main=(i == 0))
+            yield group
+
+    # Upsert (city_id, date, *columns) rows from WeatherSchema.daily_rows into their shards, then refresh the rollups
+    # and bump the generations of the affected periods, committing one transaction per group of shards
+    # Any transaction the caller has open is committed first, since shards cannot be attached inside one
+    def write_rows(self, conn, rows):
+        rows_by_shard = {}
+        for row in rows:
+            rows_by_shard.setdefault(self.shard_year(row[1]), []).append(row)
+        shard_years = sorted(rows_by_shard)
+        conn.commit()
+        ensure_shard_table(conn)
+        group_size = attach_limit(conn)
+        for i in range(0, len(shard_years), group_size):
+            group = shard_years[i:i + group_size]
+            self._set_view(conn, group, create=True)
+            with conn:
+                self.register(conn, group)
+                dates_by_city = {}
+                for shard_year in group:
+                    shard_rows = rows_by_shard[shard_year]
+                    conn.executemany(daily_upsert_sql(f"{self.schema_name(shard_year)}.daily_weather_entries"), shard_rows)
+                    # Days still in the main table (not migrated yet) move to the shard, so no day is stored twice
+                    conn.executemany("DELETE FROM main.daily_weather_entries WHERE city_id = ? AND date = ?",
+                                     [row[:2] for row in shard_rows])
+                    for row in shard_rows:
+                        dates_by_city.setdefault(row[0], set()).add(row[1])
+                # The view covers the main table and these shards, so each refreshed month sees all of its rows
+                for city_id, dates in dates_by_city.items():
+                    refresh_rollups(conn, city_id, dates)
+                    bump_generations(conn, city_id, dates)
+
+    # Average mean temperature per city name over an inclusive date range, ordered by city name and paged like
+    # Analytics.average_mean_temp_by_city; only shards overlapping the range are read, a group of shards at a time
+    def average_mean_temp_by_city(self, conn, date_from, date_to, after=None, limit=None):
+        totals = {}
+        for _ in self.shard_groups(conn, date_from, date_to):
+            cursor = conn.execute('''
+                SELECT c.name, SUM(d.mean_temp), COUNT(d.mean_temp)
+                FROM daily_weather_entries d
+                JOIN cities c ON d.city_id = c.id
+                WHERE d.date BETWEEN ? AND ?
+                GROUP BY c.name
+            ''', (date_from, date_to))
+            for name, total, count in cursor.fetchall():
+                name_total, name_count = totals.get(name, (0.0, 0))
+                totals[name] = (name_total + (total or 0.0), name_count + count)
+            cursor.close()
+        names = sorted(name for name in totals if after is None or name > after)
+        if limit is not None and limit >= 0:
+            names = names[:limit]
+        return [(name, totals[name][0] / totals[name][1] if totals[name][1] else None) for name in names]
+
+# Function to make daily_weather_entries cover the shards overlapping a date range (or every shard) before a query
+# Does nothing on a database that is not sharded; raises ValueError if the range needs too many shards
+def use_shards(conn, date_from=None, date_to=None):
+    router = ShardRouter.for_connection(conn)
+    if router is not None:
+        router.use_range(conn, date_from, date_to)
+
+# Generator to run a query once per group of shards overlapping a date range; yields once on an unsharded database
+def shard_groups(conn, date_from=None, date_to=None):
+    router = ShardRouter.for_connection(conn)
+    if router is None:
+        yield []
+    else:
+        yield from router.shard_groups(conn, date_from, date_to)
+
+# Function to move the rows of the main daily_weather_entries table into shards, one shard per transaction
+# A database that is already sharded keeps its layout; rows already in a shard win over older rows in the main table
+def migrate_to_shards(conn, router=None):
+    existing = ShardRouter.for_connection(conn)
+    if existing is not None and router is not None and router.years_per_shard != existing.years_per_shard:
+        raise ValueError(f"The database already uses {existing.years_per_shard}-year shards")
+    router = existing or router or ShardRouter()
+    ensure_shard_table(conn)
+    conn.commit()
+    years = [row[0] for row in conn.execute("SELECT DISTINCT substr(date, 1, 4) FROM main.daily_weather_entries ORDER BY 1")]
+    columns = ", ".join(SHARD_COLUMNS)
+    for shard_year in sorted({router.shard_year(year) for year in years}):
+        router.detach_all(conn)
+        router.attach(conn, [shard_year], create=True)
+        start, end = f"{shard_year:04d}-01-01", f"{shard_year + router.years_per_shard:04d}-01-01"
+        with conn:
+            router.register(conn, [shard_year])
+            rows = conn.execute(f'''
+                INSERT INTO {router.schema_name(shard_year)}.daily_weather_entries ({columns})
+                SELECT {columns} FROM main.daily_weather_entries WHERE date >= ? AND date < ?
+                ON CONFLICT (city_id, date) DO NOTHING
+            ''', (start, end)).rowcount
+            conn.execute("DELETE FROM main.daily_weather_entries WHERE date >= ? AND date < ?", (start, end))
+        print(f"Moved {rows} rows to {router.shard_path(shard_year)}")
+    router.detach_all(conn)
+
+# Function to compact a shard whose years are finished, so its file is as small as possible before it is backed up
+def compact_shard(conn, shard_year):
+    shards = registered_shards(conn)
+    if shard_year not in shards:
+        raise ValueError(f"No shard starts at {shard_year}")
+    with sqlite3.connect(os.path.join(database_dir(conn), shards[shard_year][1])) as shard:
+        shard.execute("VACUUM")
+
+# Shard the database or compact a shard from the command line: python Shards.py migrate [years_per_shard] | compact <year>
+if __name__ == "__main__":
+    import sys
+    from Database import DATABASE_PATH, ensure_schema
+    if len(sys.argv) in (2, 3) and sys.argv[1] == "migrate":
+        with sqlite3.connect(DATABASE_PATH) as conn:
+            ensure_schema(conn)
+            migrate_to_shards(conn, ShardRouter(years_per_shard=int(sys.argv[2])) if len(sys.argv) == 3 else None)
+    elif len(sys.argv) == 3 and sys.argv[1] == "compact":
+        with sqlite3.connect(DATABASE_PATH) as conn:
+            compact_shard(conn, int(sys.argv[2]))
+    else:
+        print("Usage: python Shards.py migrate [years_per_shard] | compact <year>")
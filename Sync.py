@@ -0,0 +1,71 @@
+import sqlite3
+from datetime import date, timedelta
+from Database import DATABASE_PATH, ensure_schema
+from Ingestion import run_ingestion
+from Shards import shard_groups
+
+# Function to return yesterday's date, the latest day the archive API has complete data for
+def yesterday():
+    return (date.today() - timedelta(days=1)).isoformat()
+
+# Function to fetch the dates already stored for a city between start_date and end_date
+def stored_dates(conn, city_name, start_date, end_date):
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT d.date FROM daily_weather_entries d
+        JOIN cities c ON d.city_id = c.id
+        WHERE c.name = ? AND d.date >= ? AND d.date <= ?
+    ''', (city_name, start_date, end_date))
+    dates = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    return dates
+
+# Function to turn the dates missing from start_date..end_date into a list of contiguous (start, end) ranges
+def missing_date_ranges(dates, start_date, end_date):
+    ranges = []
+    day = date.fromisoformat(start_date)
+    last = date.fromisoformat(end_date)
+    range_start = None
+    while day <= last:
+        if day.isoformat() in dates:
+            if range_start is not None:
+                ranges.append((range_start.isoformat(), (day - timedelta(days=1)).isoformat()))
+                range_start = None
+        elif range_start is None:
+            range_start = day
+        day += timedelta(days=1)
+    if range_start is not None:
+        ranges.append((range_start.isoformat(), last.isoformat()))
+    return ranges
+
+# Function to work out which date ranges each city is missing, grouping cities that miss the same range
+# On a sharded database the stored dates are collected from the shards covering the range, a group of shards at a time
+def plan_sync(cities, start_date, end_date, db_path=DATABASE_PATH):
+    plan = {}
+    with sqlite3.connect(db_path) as conn:
+        ensure_schema(conn)
+        dates = {city["city"]: set() for city in cities}
+        for _ in shard_groups(conn, start_date, end_date):
+            for city in cities:
+                dates[city["city"]] |= stored_dates(conn, city["city"], start_date, end_date)
+        for city in cities:
+            for date_range in missing_date_ranges(dates[city["city"]], start_date, end_date):
+                plan.setdefault(date_range, []).append(city)
+    return plan
+
+# Function to fetch and upsert only the days each city is missing
+# Cities missing the same range (typically just yesterday) are fetched together so they can share batched requests
+# ingest_func is run_ingestion, or run_pipeline with a raw fetch function and a batch write function
+def run_incremental_sync(cities, fetch_func, insert_func, start_date, end_date=None, db_path=DATABASE_PATH,
+                         ingest_func=run_ingestion, **ingestion_options):
+    end_date = end_date or yesterday()
+    plan = plan_sync(cities, start_date, end_date, db_path)
+    if not plan:
+        print(f"All cities are up to date from {start_date} to {end_date}")
+        return []
+
+    all_stats = []
+    for (range_start, range_end), range_cities in sorted(plan.items()):
+        print(f"Syncing {len(range_cities)} cities from {range_start} to {range_end}...")
+        all_stats.append(ingest_func(range_cities, fetch_func, insert_func, range_start, range_end, **ingestion_options))
+    return all_stats
@@ -0,0 +1,134 @@
+from datetime import datetime, timezone
+from itertools import repeat
+
+# Open-Meteo daily variables and the daily_weather_entries column each one is stored in
+# Adding a variable here requests it on the next ingest and adds its column on the next ensure_schema
+DAILY_COLUMNS = {
+    "temperature_2m_min": "min_temp",
+    "temperature_2m_max": "max_temp",
+    "temperature_2m_mean": "mean_temp",
+    "precipitation_sum": "precipitation",
+    "apparent_temperature_max": "apparent_max_temp",
+}
+
+# Open-Meteo hourly variables and the hourly_weather_entries column each one is stored in
+HOURLY_COLUMNS = {
+    "temperature_2m": "temperature",
+    "apparent_temperature": "apparent_temperature",
+    "relative_humidity_2m": "relative_humidity",
+    "precipitation": "precipitation",
+    "wind_speed_10m": "wind_speed",
+}
+
+# Function to list the columns of a table
+def table_columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+# Function to add the daily columns and the hourly table (with its columns) that are missing from the database
+# Hourly rows are keyed by (city_id, unix time) in a WITHOUT ROWID table, so each hour costs one small clustered row
+def ensure_weather_columns(conn):
+    existing = table_columns(conn, "daily_weather_entries")
+    for column in DAILY_COLUMNS.values():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE daily_weather_entries ADD COLUMN {column} REAL")
+
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS hourly_weather_entries (
+            city_id INTEGER NOT NULL,
+            time INTEGER NOT NULL,
+            {', '.join(f"{column} REAL" for column in HOURLY_COLUMNS.values())},
+            PRIMARY KEY (city_id, time)
+        ) WITHOUT ROWID
+    ''')
+    existing = table_columns(conn, "hourly_weather_entries")
+    for column in HOURLY_COLUMNS.values():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE hourly_weather_entries ADD COLUMN {column} REAL")
+    conn.commit()
+
+# Function to build the statement inserting a day of weather data, or updating it if the city already has a row for that date
+# table can name a daily table in an attached database, e.g. a shard
+def daily_upsert_sql(table="daily_weather_entries"):
+    columns = list(DAILY_COLUMNS.values())
+    updates = ",\n        ".join(f"{column} = excluded.{column}" for column in columns)
+    return f'''
+    INSERT INTO {table} (city_id, date, {', '.join(columns)})
+    VALUES ({', '.join('?' for _ in range(len(columns) + 2))})
+    ON CONFLICT (city_id, date) DO UPDATE SET
+        {updates}
+'''
+
+# Function to turn an API daily payload into (city_id, date, *columns) rows for daily_upsert_sql
+# Variables missing from the payload are stored as NULL
+def daily_rows(city_id, daily_data):
+    dates = daily_data["time"]
+    columns = [daily_data.get(variable) or [None] * len(dates) for variable in DAILY_COLUMNS]
+    return list(zip(repeat(city_id), dates, *columns))
+
+# Function to turn an API daily payload into row mappings keyed by column name
+def daily_row_mappings(city_id, daily_data):
+    names = ["city_id", "date", *DAILY_COLUMNS.values()]
+    return [dict(zip(names, row)) for row in daily_rows(city_id, daily_data)]
+
+# Function to convert an API hourly timestamp ('YYYY-MM-DDTHH:MM', requested in GMT) to unix seconds
+def to_unix_time(timestamp):
+    return int(datetime.fromisoformat(timestamp).replace(tzinfo=timezone.utc).timestamp())
+
+# Function to convert unix seconds back to the API's 'YYYY-MM-DDTHH:MM' GMT format
+def from_unix_time(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime("%Y-%m-%dT%H:%M")
+
+# Function to convert a list of API hourly timestamps to unix seconds
+# API hourly series are contiguous, so when the endpoints confirm it the times are generated instead of parsed one by one
+def hourly_times(timestamps):
+    if not timestamps:
+        return []
+    first = to_unix_time(timestamps[0])
+    if to_unix_time(timestamps[-1]) == first + 3600 * (len(timestamps) - 1):
+        return range(first, first + 3600 * len(timestamps), 3600)
+    return [to_unix_time(timestamp) for timestamp in timestamps]
+
+# Function to build the statement upserting hourly rows; it uses named parameters so it runs on both
+# sqlite3 connections and SQLAlchemy sessions
+def hourly_upsert_sql():
+    columns = list(HOURLY_COLUMNS.values())
+    updates = ",\n        ".join(f"{column} = excluded.{column}" for column in columns)
+    return f'''
+    INSERT INTO hourly_weather_entries (city_id, time, {', '.join(columns)})
+    VALUES (:city_id, :time, {', '.join(f":{column}" for column in columns)})
+    ON CONFLICT (city_id, time) DO UPDATE SET
+        {updates}
+'''
+
+# Function to turn an API hourly payload into row mappings for hourly_upsert_sql
+def hourly_rows(city_id, hourly_data):
+    times = hourly_data["time"]
+    names = ["time", *HOURLY_COLUMNS.values()]
+    columns = [hourly_times(times)]
+    columns += [hourly_data.get(variable) or [None] * len(times) for variable in HOURLY_COLUMNS]
+    return [dict(zip(names, row), city_id=city_id) for row in zip(*columns)]
+
+# Function to upsert the hourly data attached to a daily payload, if any, on a sqlite3 connection
+def write_hourly_data(conn, city_id, daily_data):
+    hourly_data = daily_data.get("hourly")
+    if hourly_data:
+        conn.executemany(hourly_upsert_sql(), hourly_rows(city_id, hourly_data))
+
+# Function to fetch a city's hourly rows for the dates [date_from, date_to], with times as 'YYYY-MM-DDTHH:MM' strings
+def hourly_series(connection, city_id, date_from, date_to, columns=None):
+    columns = list(columns or HOURLY_COLUMNS.values())
+    unknown = [column for column in columns if column not in HOURLY_COLUMNS.values()]
+    if unknown:
+        raise ValueError(f"Unknown hourly columns: {', '.join(unknown)}")
+    query = f'''
+        SELECT time, {', '.join(columns)} FROM hourly_weather_entries
+        WHERE city_id = ? AND time >= ? AND time < ?
+        ORDER BY time
+    '''
+    start = to_unix_time(f"{date_from}T00:00")
+    end = to_unix_time(f"{date_to}T00:00") + 86400
+    cursor = connection.cursor()
+    cursor.execute(query, (city_id, start, end))
+    rows = [(from_unix_time(row[0]), *row[1:]) for row in cursor.fetchall()]
+    cursor.close()
+    return rows
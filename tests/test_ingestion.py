@@ -0,0 +1,74 @@
+import json
+import os
+import sys
+import threading
+import unittest
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Ingestion import run_ingestion
+from OpenMeteo import fetch_weather_data_batch
+
+# Handler answering archive requests like Open-Meteo: one location object per requested latitude,
+# with a mean temperature for every day of the requested range
+class StubArchiveHandler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        StubArchiveHandler.requests_seen.append(params)
+        day, last = date.fromisoformat(params["start_date"][0]), date.fromisoformat(params["end_date"][0])
+        days = []
+        while day <= last:
+            days.append(day.isoformat())
+            day += timedelta(days=1)
+        latitudes = params["latitude"][0].split(",")
+        locations = [{"daily": {"time": days, "temperature_2m_mean": [float(lat)] * len(days)}} for lat in latitudes]
+        body = json.dumps(locations if len(locations) > 1 else locations[0]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class RunIngestionTest(unittest.TestCase):
+    def setUp(self):
+        StubArchiveHandler.requests_seen = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubArchiveHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.api_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/archive"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_ingests_every_city_from_the_stub_server(self):
+        cities = [{"city": f"City {i}", "lat": i, "lon": i, "country_id": 1} for i in range(5)]
+        written = {}
+        lock = threading.Lock()
+
+        def insert(city_name, daily_data, lat, lon, country_id):
+            with lock:
+                written[city_name] = (daily_data["time"], daily_data["temperature_2m_mean"])
+
+        stats = run_ingestion(cities, None, insert, "2024-01-01", "2024-01-10", max_workers=2, requests_per_second=0,
+                              api_url=self.api_url, batch_fetch_func=fetch_weather_data_batch, batch_size=2)
+
+        self.assertEqual(len(StubArchiveHandler.requests_seen), 3)
+        self.assertEqual(sorted(written), [city["city"] for city in cities])
+        for city in cities:
+            days, temperatures = written[city["city"]]
+            self.assertEqual((days[0], days[-1], len(days)), ("2024-01-01", "2024-01-10", 10))
+            self.assertEqual(temperatures, [float(city["lat"])] * 10)
+        self.assertEqual((stats.cities, stats.rows, stats.failures), (5, 50, 0))
+        self.assertGreater(stats.cities_per_second(), 0)
+        self.assertGreater(stats.rows_per_second(), 0)
+
+if __name__ == "__main__":
+    unittest.main()